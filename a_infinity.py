@@ -2,6 +2,19 @@
 
 import fields as fi
 from linear_algebra import *
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from itertools import repeat
+import weakref
+
+def _ker_im(F,method,primes):
+    '''Returns F.ker_im(method,primes) (for handing out to executors).'''
+    return F.ker_im(method,primes)
+
+def _cohomology(Z,method,primes,reduce):
+    '''Returns Z.cohomology(method,primes,reduce=reduce) (for handing
+    out to executors).'''
+    return Z.cohomology(method,primes,reduce=reduce)
 
 class A8Category(AlgebraicStructure):
     '''The class of A_\infty-categories.
@@ -80,6 +93,33 @@ class A8Category(AlgebraicStructure):
             Returns the A_\infty Yoneda module associated to the
             object X.
 
+        A.euler_form()
+
+            Returns the Euler pairing on the Grothendieck group K_0,
+            as a dictionary {(X,Y): chi(A[(X,Y)])} where chi is the
+            Euler characteristic sum_i (-1)^i dim A[(X,Y)]^i.
+
+        A.k0_class(M)
+
+            Returns the class of the module M in K_0 as a dictionary
+            {X: chi(M[X])}. In particular, sum(A.k0_class(M).values())
+            is the Euler characteristic of M.total().
+
+        A.reflection(X)
+
+            Returns the matrix {(Y,Z): int} by which the twist around
+            X acts on K_0 (computed once for each X).
+
+        A.k0_twist(v,X_1,...,X_n)
+
+            Returns the class of M.twist(X_1)...twist(X_n) given the
+            class v of M, without constructing any modules.
+
+        A.k0_bounds(v)
+
+            Returns a 2-tuple of lower bounds for the total dimension
+            and the width of the cohomology of a module with class v.
+
     '''
 
     _required_fields=['field','objects','morphisms','operations']
@@ -181,8 +221,67 @@ class A8Category(AlgebraicStructure):
     def total_yoneda(self):
         total=A8Module(self,{},{})
         for X in self.objects:
-            total=(total.oplus(self.yoneda(X))).simplify()
+            total=total.oplus(self.yoneda(X))
         return total
+
+    def euler_form(self):
+        '''Returns the Euler pairing {(X,Y): chi(A[(X,Y)])} on K_0.'''
+        A=self
+
+        def chi(V):
+            return sum((-1)**(n%2)*V.gr_dim[n] for n in V.gr_dim)
+
+        return {(X,Y): chi(A[(X,Y)]) for X in A.objects for Y in A.objects}
+
+    def k0_class(self,M):
+        '''Returns the class {X: chi(M[X])} of the module M in K_0.'''
+        return {X: sum((-1)**(n%2)*M[X].gr_dim[n] for n in M[X].gr_dim)
+                for X in self.objects}
+
+    @lazyproperty
+    def euler_matrix(self):
+        '''The Euler pairing, computed once and stored.'''
+        return self.euler_form()
+
+    @lazyproperty
+    def reflections(self):
+        '''Returns the cache {X: matrix} of A.reflection.'''
+        return {}
+
+    def reflection(self,X):
+        '''Returns the matrix {(Y,Z): int} of the twist around X on K_0.
+
+        The twist of M around X is the cone on M[X] (x) yoneda(X)-->M,
+        so its class is v-v[X]e_X where e_X is the class of yoneda(X),
+        i.e. e_X[Y]=chi(A[(Y,X)]).
+        '''
+        if X not in self.reflections:
+            E=self.euler_matrix
+            self.reflections[X]={(Y,Z): (1 if Y==Z else 0)-(E[(Y,X)] if Z==X else 0)
+                                 for Y in self.objects for Z in self.objects}
+        return self.reflections[X]
+
+    def k0_twist(self,v,*word):
+        '''Returns the class in K_0 of the twist along word of a module
+        with class v (twisting around word[0] first), by applying the
+        matrices reflection(X).'''
+        v=dict(v)
+        for X in word:
+            R=self.reflection(X)
+            v={Y: sum(R[(Y,Z)]*v[Z] for Z in self.objects if v[Z])
+               for Y in self.objects}
+        return v
+
+    def k0_bounds(self,v):
+        '''Given the class v of a module M in K_0, returns lower bounds
+        for the total dimension of M.total() and for the width
+        max-min of its degrees: the cohomology at X has dimension at
+        least |v[X]|, and has even (resp. odd) degree part if v[X]>0
+        (resp. v[X]<0), so if both signs occur the width is at least 1.
+        '''
+        dimension=sum(abs(v[X]) for X in v)
+        signs={c>0 for c in v.values() if c}
+        return dimension,(1 if len(signs)==2 else 0)
         
 class DynkinGraph():
     '''The class of Dynkin graphs.
@@ -322,12 +421,22 @@ class CochainComplex(AlgebraicStructure):
 
     METHODS:
 
-        Z.cohomology()
+        Z.cohomology(method=None,primes=None,executor=None,reduce=False)
 
             Returns the cohomology of Z as a dictionary of the form:
 
                 {i: rank of H^i(Z)}
 
+            Over the rationals, method='multimodular' computes the
+            ranks modulo several word-sized primes (see
+            SparseMatrix.multimodular_rank). Over Z/p with p large,
+            method='blackbox' computes them without elimination (see
+            SparseMatrix.blackbox_rank), and method='auto' does so
+            only for the large graded pieces. If an executor (e.g. a
+            concurrent.futures.ProcessPoolExecutor) is given, the
+            graded pieces are handed out to it. If reduce=True, Z is
+            first replaced by Z.reduce().
+
         Z.display()
 
             Displays the space of cochains and the
@@ -337,6 +446,18 @@ class CochainComplex(AlgebraicStructure):
 
             Returns true if d^2=0, otherwise raises exception.
 
+        Z.reduce()
+
+            Returns a smaller cochain complex with the same
+            cohomology as Z, by cancelling pairs of basis vectors
+            joined by an invertible entry of the differential.
+
+        Z.contraction()
+
+            Returns a 4-tuple (H,i,p,h) where H is the cohomology of
+            Z, i:H-->Z and p:Z-->H are chain maps and h is a homotopy
+            with pi=1 and id-ip=dh+hd.
+
         Z.otimes(M)
 
             Returns the tensor product of a cochain complex with an
@@ -346,18 +467,36 @@ class CochainComplex(AlgebraicStructure):
 
     _required_fields=['cochains','differential']
 
-    def cohomology(self):
+    def cohomology(self,method=None,primes=None,executor=None,reduce=False):
         '''Returns the cohomology of the cochain complex as a dictionary of
         the form {i: rank of H^i(Z)}
+
+        The ranks of the graded pieces of the differential are computed
+        with ker_im(method,primes); over the rationals, method=
+        'multimodular' computes them modulo several primes. The pieces
+        are independent, so if an executor is given they are computed
+        by executor.map. If reduce=True, we first cancel as many pairs
+        of basis vectors as we can (see reduce), so that only what is
+        left has to be eliminated; degrees in which nothing is left
+        are then missing from the answer.
         '''
+        if reduce:
+            return self.reduce().cohomology(method,primes,executor)
         G=self.cochains.graded_pieces # Dictionary of Z_n, graded pieces of Z
         graded_maps={} # Dictionary to store restriction d_n of d to Z_n
         kernels={}     # Dictionary to store kernels of d_n
         images={}      # Dictionary to store images of d_n
         cohom={}       # Dictionary to store cohomology groups
         graded_maps={n: self.differential.restrict(G[n]) for n in G}
-        for n in G:
-            kernels[n],images[n]=graded_maps[n].ker_im()
+        if executor is None:
+            for n in G:
+                kernels[n],images[n]=graded_maps[n].ker_im(method,primes)
+        else:
+            n_list=list(G)
+            results=executor.map(_ker_im,[graded_maps[n] for n in n_list],
+                                 repeat(method),repeat(primes))
+            for n,(kernel,image) in zip(n_list,results):
+                kernels[n],images[n]=kernel,image
         for n in G:
             if n-1 in G:
                 cohom[n]=kernels[n]-images[n-1]
@@ -365,6 +504,143 @@ class CochainComplex(AlgebraicStructure):
                 cohom[n]=kernels[n]
         return cohom
 
+    def reduce(self):
+        '''Returns a cochain complex, spanned by some of the basis vectors
+        of Z=(C,d), which is quasi-isomorphic to Z.
+
+        If the component x of d(a) at b is invertible (over an infinite
+        field we only use x=1 or -1, so that no denominators appear)
+        then a and b can be cancelled: the basis vectors other than a
+        and b span a complex quasi-isomorphic to Z, with differential
+
+            d'(c) = d(c) - (d(c)_b/x) d(a)
+
+        (dropping the components at a and b). We cancel pairs greedily,
+        preferring those b which occur in few d(c) to limit fill-in,
+        until there are none left; the cancelled pairs form an acyclic
+        matching and the result is its Morse complex. Only d(c) for c
+        in the same degree as a change, so each cancellation is cheap,
+        and after a cone many entries of the differential are units.
+        '''
+        C,d=self.cochains,self.differential
+        K=C.field
+        if K.order is None:
+            def is_unit(x):
+                return x==K.one or x==K.minus_one
+        else:
+            def is_unit(x):
+                return x!=0
+        out={k: {j: x for j,x in d.maps[k].components.items() if x!=0}
+             if k in d.maps else {} for k in C.basis}
+        inc={k: set() for k in C.basis}    # {j: {k: j occurs in d(k)}}
+        for k,v in out.items():
+            for j in v:
+                inc[j].add(k)
+
+        def cancel(a,b):
+            row=out.pop(a)
+            x=row[b]
+            for j in row:
+                inc[j].discard(a)
+            for k in inc.pop(a):
+                del out[k][a]
+            for c in inc.pop(b):
+                col=out[c]
+                t=col.pop(b)/x
+                for j,z in row.items():
+                    if j==b:
+                        continue
+                    if j in col:
+                        w=col[j]-t*z
+                        if w==0:
+                            del col[j]
+                            inc[j].discard(c)
+                        else:
+                            col[j]=w
+                    else:
+                        col[j]=-(t*z)
+                        inc[j].add(c)
+            for j in out.pop(b):
+                inc[j].discard(b)
+
+        cancelled=True
+        while cancelled:
+            cancelled=False
+            for a in list(out):
+                if a not in out:
+                    continue
+                candidates=[b for b,x in out[a].items() if is_unit(x)]
+                if candidates:
+                    cancel(a,min(candidates,key=lambda b: len(inc[b])))
+                    cancelled=True
+        V=VectorSpace(K)
+        V.basis.update({k: C.basis[k] for k in out})
+        new_d=LinearMap(V,V,d.deg)
+        new_d.maps.update({k: Vector(V,v) for k,v in out.items() if v})
+        return CochainComplex(V,new_d)
+
+    def contraction(self):
+        '''Returns a 4-tuple (H,i,p,h) which contracts the cochain complex
+        Z=(C,d) onto its cohomology. Here:
+
+            H [VectorSpace] is the cohomology of Z (indexed by integers),
+            i: H-->C and p: C-->H are chain maps of degree 0,
+            h: C-->C is a homotopy of degree -1,
+
+        and they satisfy pi=1, id-ip=dh+hd, hh=0, hi=0, ph=0.
+
+        To construct these, we write each graded piece C^n as
+        B^n (+) H^n (+) D^n, where B^n is the image of d, B^n (+) H^n
+        is the kernel of d and D^n is spanned by basis vectors
+        which d maps isomorphically onto B^{n+1}. Then h is the
+        inverse of d:D^n-->B^{n+1} (extended by zero) and p is the
+        projection onto H^n.
+        '''
+        C,d=self.cochains,self.differential
+        K=C.field
+        G=C.graded_pieces
+        images={}      # Echelon form of d restricted to C^n
+        kernels={}     # Echelon form of B^n (+) H^n
+        harmonic=[]    # (n, vector) spanning H^n
+        for n in sorted(G):
+            E=Echelon(K)
+            cycles=[]
+            for k in G[n].basis:
+                remainder,combination=E.add(d[k].components,k)
+                if not remainder:
+                    cycle={j: -x for j,x in combination.items()}
+                    cycle[k]=K.one
+                    cycles.append(cycle)
+            images[n]=E
+            B=Echelon(K)
+            if n-1 in images:
+                for j in images[n-1].labels:
+                    B.add(d[j].components,('b',j))
+            for cycle in cycles:
+                remainder,combination=B.add(cycle,('h',len(harmonic)))
+                if remainder:
+                    harmonic.append((n,cycle))
+            kernels[n]=B
+        H=VectorSpace(K)
+        H.basis.update({t: n for t,(n,cycle) in enumerate(harmonic)})
+        i=LinearMap(H,C,0)
+        i.maps.update({t: Vector(C,cycle) for t,(n,cycle) in enumerate(harmonic)})
+        p=LinearMap(C,H,0)
+        h=LinearMap(C,C,-1)
+        for n in G:
+            for k in G[n].basis:
+                # First subtract the part of e_k which lies in D^n...
+                remainder,combination=images[n].reduce(d[k].components)
+                v={j: -x for j,x in combination.items()}
+                v[k]=v[k]+K.one if k in v else K.one
+                # ...and then split the resulting cycle into B^n (+) H^n.
+                remainder,combination=kernels[n].reduce(v)
+                p.maps[k]=Vector(H,{t: x for (part,t),x in combination.items()
+                                    if part=='h'}).chomp()
+                h.maps[k]=Vector(C,{j: x for (part,j),x in combination.items()
+                                    if part=='b'}).chomp()
+        return H,i.chomp(),p.chomp(),h.chomp()
+
     def display(self):
         '''Prints the space of cochains and the differential.'''
         print(self.cochains)
@@ -392,10 +668,146 @@ class CochainComplex(AlgebraicStructure):
                     for X in M.modules}
         for word in M.operations:
             if len(word)>1:
+                # Reshape the KroneckerMap before expanding it, so that
+                # its values are only computed once.
                 new_op=Z.Id().otimes(M.mu(*word))
-                operations.update({word: new_op.flatten(1).unflatten(0,2)})               
+                operations.update({word: new_op.flatten(1).unflatten(0,2).expand()})               
         return A8Module(A,modules,operations)
                 
+class ColumnarOperations(MutableMapping):
+    '''The operations of a compact A_\infty-module (see A8Module.compact).
+
+    USAGE:
+
+        ops=ColumnarOperations(operations)
+
+    behaves like the dictionary operations {word: LinearMap}, but each
+    operation is stored as a ColumnarMap (three flat arrays) and is
+    only turned back into a LinearMap when it is looked up. The most
+    recently used LinearMaps (at most ops.cache_size of them) are kept,
+    so that repeated lookups of the same operation are cheap; they
+    should be treated as read-only, and an operation is changed by
+    assigning to ops[word].
+
+    ATTRIBUTES:
+
+        ops.columns [dict] {word: ColumnarMap}
+    '''
+    cache_size=16
+
+    def __init__(self,operations=()):
+        self.columns={}
+        self.views=OrderedDict()
+        self.update(operations)
+
+    def __getitem__(self,word):
+        if word in self.views:
+            self.views.move_to_end(word)
+            return self.views[word]
+        F=self.columns[word].to_map()
+        self.views[word]=F
+        if len(self.views)>self.cache_size:
+            self.views.popitem(last=False)
+        return F
+
+    def __setitem__(self,word,F):
+        self.views.pop(word,None)
+        self.columns[word]=F.columnar()
+
+    def __delitem__(self,word):
+        self.views.pop(word,None)
+        del self.columns[word]
+
+    def __contains__(self,word):
+        return word in self.columns
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __len__(self):
+        return len(self.columns)
+
+    def __getstate__(self):
+        return {'columns': self.columns}
+
+    def __setstate__(self,state):
+        self.columns=state['columns']
+        self.views=OrderedDict()
+
+    def nnz(self):
+        '''Returns the total number of stored entries.'''
+        return sum(F.nnz() for F in self.columns.values())
+
+class LazyOperations(MutableMapping):
+    '''The operations of a lazy A_\infty-module (see A8Module.twist).
+
+    USAGE:
+
+        ops=LazyOperations()
+        ops.defer(word,build)
+
+    behaves like the dictionary operations {word: LinearMap}, except
+    that the operation for word is only computed (by calling build())
+    when it is first looked up; it is then kept. Checking whether a
+    word is present or iterating over the words does not compute
+    anything. Once an operation has been computed its builder is
+    dropped, so that whatever it refers to (e.g. the module which was
+    twisted) can be freed.
+
+    Pickling computes all of the remaining operations.
+
+    ATTRIBUTES:
+
+        ops.entries [dict] {word: LinearMap or None}
+
+            The operations, with None for those not yet computed.
+
+        ops.builders [dict] {word: function}
+
+            The builders of the operations not yet computed.
+    '''
+    def __init__(self,operations=()):
+        self.entries={}
+        self.builders={}
+        self.update(operations)
+
+    def defer(self,word,build):
+        '''Sets the operation for word to be build(), when needed.'''
+        self.entries[word]=None
+        self.builders[word]=build
+
+    def __getitem__(self,word):
+        F=self.entries[word]
+        if F is None:
+            F=self.builders[word]()
+            self.entries[word]=F
+            del self.builders[word]
+        return F
+
+    def __setitem__(self,word,F):
+        self.builders.pop(word,None)
+        self.entries[word]=F
+
+    def __delitem__(self,word):
+        self.builders.pop(word,None)
+        del self.entries[word]
+
+    def __contains__(self,word):
+        return word in self.entries
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getstate__(self):
+        return {'entries': {word: self[word] for word in self.entries}}
+
+    def __setstate__(self,state):
+        self.entries=state['entries']
+        self.builders={}
+
 class A8Module(AlgebraicStructure):
     '''The class of A_\infty-modules.
 
@@ -454,6 +866,11 @@ class A8Module(AlgebraicStructure):
             Returns M.operations[(X_0,...,X_d)] if defined or else
             zero.
 
+        M.domain(X_0,...,X_d)
+
+            Returns the source of M.mu(X_0,...,X_d) (without computing
+            it, if M is lazy).
+
         M.display()
 
         M.verify()
@@ -466,29 +883,56 @@ class A8Module(AlgebraicStructure):
             Returns the same A_\infty-module but re-indexes the bases
             for its vector spaces to make it more compact.
 
+        M.minimal_model()
+
+            Returns a minimal A_\infty-module (i.e. with \mu^1=0)
+            which is quasi-isomorphic to M; its vector spaces are the
+            cohomology groups of M.cpx(X).
+
         M.cpx(X)
 
             Returns the cochain complex M[X] with differential
             M.mu(X).
 
-        M.total()
+        M.total(method=None,primes=None,executor=None,reduce=False)
 
             Returns the direct sum of cohomology groups:
 
-                (+)_{X in A.objects} M.cpx(X).cohomology()
+                (+)_{X in A.objects} M.cpx(X).cohomology(method,primes)
+
+            If an executor is given, the objects are handed out to it.
+            If method='incremental', the ranks are read off from
+            M.echelon(X,n) instead.
+
+        M.echelon(X,n)
 
-        M.width()
+            Returns an echelon form (see Echelon) of the columns of
+            M.mu(X) in degree n. These are kept, and the echelon forms
+            of a twist of M start from those of M.
 
-            Returns the difference between the maximal and minimal
-            grading present in M.total().
+        M.width(method=None,primes=None)
+
+            Returns the minimal and maximal grading present in
+            M.total(), computing only as much of it as it needs to.
 
         M.shift(m=1)
 
             Returns M shifted down in degree by m.
 
-        M.twist(X)
+        M.twist(X,reduce=False,lazy=False)
+
+            Returns the twist of M around the object X (replaced by
+            its minimal model if reduce=True). If lazy=True, the
+            operations of the twist are only computed when they are
+            asked for, so e.g. M.twist(X,lazy=True).total() only
+            computes the differentials.
+
+        M.compact()
 
-            Returns the twist of M around the object X.
+            Returns the same A_\infty-module but with its operations
+            stored as flat arrays (see ColumnarOperations). This uses
+            far less memory and pickles quickly; the operations are
+            turned back into LinearMaps when they are asked for.
     '''
 
     _required_fields=['cat','modules','operations']
@@ -497,6 +941,18 @@ class A8Module(AlgebraicStructure):
     def field(self):
         '''Returns the field of definition of the module.'''
         return self.cat.field
+
+    @lazyproperty
+    def echelons(self):
+        '''Returns the cache {(X,n): Echelon} of M.echelon.'''
+        return {}
+
+    @lazyproperty
+    def parent(self):
+        '''For C=M.twist(X), the 2-tuple (weak reference to M, starts)
+        where M[W] sits in C[W] from index starts[W] onwards (see
+        twist); None for other modules.'''
+        return None
     
     def __getitem__(self,X):
         '''M[X] returns M.modules[X] if defined and zero otherwise.'''
@@ -507,6 +963,19 @@ class A8Module(AlgebraicStructure):
         else:
             return VectorSpace(K)
 
+    def domain(self,*word):
+        '''M.domain(X_0,...,X_{d-1}) returns the source of
+        M.mu(X_0,...,X_{d-1}), without computing the operation.'''
+        M,A=self,self.cat
+        d=len(word)
+        X=word[d-1]
+        if d>2:
+            return (M[X].otimes(A.hom(*word))).flatten(1)
+        elif d==2:
+            return M[X].otimes(A.hom(*word))
+        else:
+            return M[X]
+
     def mu(self,*word):
         '''M.mu(X_0,...,X_{d-1}) returns M.operations[(X_0,...,X_{d-1})] if
         defined and zero otherwise.'''
@@ -514,16 +983,7 @@ class A8Module(AlgebraicStructure):
         if word in M.operations:
             return M.operations[word]
         else:
-            A=M.cat
-            d=len(word)
-            X,Y=word[d-1],word[0]
-            if d>2:
-                new_domain=(M[X].otimes(A.hom(*word))).flatten(1)
-            elif d==2:
-                new_domain=M[X].otimes(A.hom(*word))
-            else:
-                new_domain=M[X]
-            return LinearMap(new_domain,M[Y],2-d)
+            return LinearMap(M.domain(*word),M[word[0]],2-len(word))
 
     def display(self):
         '''Displays the modules and operations of M.'''
@@ -617,9 +1077,12 @@ class A8Module(AlgebraicStructure):
             M.simplify()
 
         will return the A_\infty-module M but with all its vector spaces
-        indexed simply by integers.
+        indexed simply by integers. If they already are (as for
+        twists, cones and direct sums) then M itself is returned.
         '''
         M=self
+        if all(i==n for X in M.modules for n,i in enumerate(M[X].basis)):
+            return M
         N=A8Module(self.cat,{},{})
         translator={}
         for X in self.modules:
@@ -655,29 +1118,227 @@ class A8Module(AlgebraicStructure):
 
         return N
 
+    def minimal_model(self):
+        '''Returns a minimal A_\infty-module quasi-isomorphic to M, i.e. one
+        with \mu^1=0, obtained by homological perturbation.
+
+        For each object X we contract M[X] onto its cohomology H[X]
+        using M.cpx(X).contraction(), which gives maps i, p and a
+        homotopy h. The operations on H are then
+
+            \mu_H^d(x,a_{d-1},...,a_1) =
+                sum (-1)^{r-1} p\mu_M(h\mu_M(...h\mu_M(i(x),...)...),...)
+
+        where the sum is over all ways of splitting a_{d-1},...,a_1
+        into r consecutive nonempty blocks, each of which is fed
+        into one of the higher operations \mu_M^k, k>1.
+        '''
+        M,A=self,self.cat
+        K=M.field
+        N=A8Module(A,{},{})
+        contractions={X: M.cpx(X).contraction() for X in M.modules}
+        N.modules.update({X: contractions[X][0] for X in M.modules})
+        higher_ops={}
+        for word in M.operations:
+            if len(word)>1:
+                higher_ops.setdefault(word[-1],[]).append(word)
+
+        def apply_op(u,y,alphas):
+            '''Returns \mu_M(u) applied to y (x) alphas.'''
+            F=M.mu(*u)
+            ans=Vector(F.target,{})
+            for m,x in y.components.items():
+                ans+=x*F[(m,)+alphas]
+            return ans
+
+        # A partial result is a dictionary {word: {key: vector}} where
+        # the key (x,a_{d-1},...,a_{j+1}) records the input and the
+        # vector lies in M[X_j] for X_j=word[0].
+        partial={(X,): {(t,): contractions[X][1][t] for t in N[X].basis}
+                 for X in N.modules}
+        new_ops={}
+        while partial:
+            new_partial={}
+            for word,values in partial.items():
+                for u in higher_ops.get(word[0],[]):
+                    new_word=u[:-1]+word
+                    Y=u[0]
+                    H,i,p,h=contractions[Y]
+                    if len(u)==2:
+                        alpha_keys=[(a,) for a in A.hom(*u).basis]
+                    else:
+                        alpha_keys=list(A.hom(*u).basis)
+                    for key,y in values.items():
+                        for alphas in alpha_keys:
+                            z=apply_op(u,y,alphas)
+                            if not z.components:
+                                continue
+                            new_key=key+alphas
+                            finished=p(z)
+                            if finished.components:
+                                ops=new_ops.setdefault(new_word,{})
+                                if new_key in ops:
+                                    ops[new_key]+=finished
+                                else:
+                                    ops[new_key]=finished
+                            unfinished=-h(z)
+                            if unfinished.components:
+                                vals=new_partial.setdefault(new_word,{})
+                                if new_key in vals:
+                                    vals[new_key]+=unfinished
+                                else:
+                                    vals[new_key]=unfinished
+            partial=new_partial
+        for word,ops in new_ops.items():
+            F=N.mu(*word)
+            F.maps.update({key: Vector(F.target,v.components)
+                           for key,v in ops.items()})
+            if F.chomp().maps:
+                N.operations[word]=F
+        return N
+
+    def compact(self):
+        '''Returns M with its operations stored as ColumnarMaps.'''
+        if isinstance(self.operations,ColumnarOperations):
+            return self
+        return A8Module(self.cat,self.modules,
+                        ColumnarOperations(self.operations))
+
+    def echelon(self,X,n):
+        '''Returns an Echelon of the columns of M.mu(X) in degree n,
+        labelled by the basis of M[X].
+
+        If M is a twist of P (and P is still around) then M.mu(X) is
+        the block matrix
+
+            (d_T  0  )
+            (ev   d_P)
+
+        and the columns coming from P[X] are just those of P.mu(X),
+        re-indexed. So we start from P.echelon(X,n) (computing it if
+        need be), re-index its rows, and only add the columns coming
+        from T[X]. Along a braid word each column is then eliminated
+        only once, in the module where it first appears.
+        '''
+        if (X,n) in self.echelons:
+            return self.echelons[(X,n)]
+        M=self
+        E=Echelon(M.field)
+        d=M.mu(X)
+        old=set()
+        P=None if M.parent is None else M.parent[0]()
+        if P is not None and n in P[X].gr_dim:
+            start=M.parent[1][X]
+            pos={i: start+m for i,m in P[X].positions.items()}
+            P_E=P.echelon(X,n)
+            for pivot,(row,combination) in P_E.rows.items():
+                E.rows[pos[pivot]]=({pos[i]: x for i,x in row.items()},
+                                    {pos[l]: x for l,x in combination.items()})
+            E.labels.extend(pos[l] for l in P_E.labels)
+            old=set(pos.values())
+        if n in M[X].graded_pieces:
+            for k in M[X].graded_pieces[n].basis:
+                if k not in old:
+                    E.add(d.maps[k].components if k in d.maps else {},k)
+        self.echelons[(X,n)]=E
+        return E
+
+    def ker_im(self,X,n,method=None,primes=None):
+        '''Returns the 2-tuple (nullity,rank) of M.mu(X) on the degree n
+        part of M[X]. The method is passed on to LinearMap.ker_im, except
+        that method='incremental' uses M.echelon(X,n).'''
+        M=self
+        if n not in M[X].graded_pieces:
+            return 0,0
+        if method=='incremental':
+            rank=M.echelon(X,n).rank()
+            return M[X].gr_dim[n]-rank,rank
+        d_n=M.mu(X).restrict(M[X].graded_pieces[n])
+        return d_n.ker_im(method,primes)
+
     def cpx(self,X):
         '''Returns the cochain complex M(X), \mu^1.'''
         cochains=self[X]
         differential=self.mu(X)
         return CochainComplex(cochains,differential)
 
-    def total(self):
+    def total(self,method=None,primes=None,executor=None,reduce=False):
         '''Given an A_\infty-module M over a category A,
         M.total() returns the direct sum of Ext-groups
         H^*(M[X],mu^1) over all objects X in A.
+
+        The options are passed on to CochainComplex.cohomology. If an
+        executor (e.g. a concurrent.futures.ProcessPoolExecutor) is
+        given, the complexes M.cpx(X) are handed out to it, one per
+        object; the result does not depend on the order in which they
+        finish.
         '''
         A,M=self.cat,self
-        coh_gps={X: M.cpx(X).cohomology() for X in A.objects}
+        if method=='incremental':
+            if executor is not None or reduce:
+                raise ValueError('The incremental method cannot be used '
+                                 'with an executor or reduce=True')
+            coh_gps={}
+            for X in A.objects:
+                ranks={n: M.ker_im(X,n,method) for n in M[X].gr_dim}
+                coh_gps[X]={n: kernel-(ranks[n-1][1] if n-1 in ranks else 0)
+                            for n,(kernel,image) in ranks.items()}
+        elif executor is None:
+            coh_gps={X: M.cpx(X).cohomology(method,primes,reduce=reduce)
+                     for X in A.objects}
+        else:
+            objects=list(A.objects)
+            coh_gps=dict(zip(objects,executor.map(
+                _cohomology,[M.cpx(X) for X in objects],
+                repeat(method),repeat(primes),repeat(reduce))))
         total_coh={i: sum(coh_gps[X].get(i,0)
                           for X in coh_gps)
                    for i in ChainMap(*(coh_gps[X] for X in coh_gps))}
         answer={i: total_coh[i] for i in total_coh if total_coh[i]!=0}
         return answer
 
-    def width(self):
-        '''Returns the maximal and minimal degree of an element in M.total().'''
-        keys=self.total().keys()
-        return min(keys),max(keys)
+    def width(self,method=None,primes=None):
+        '''Returns the minimal and maximal degree of an element in
+        M.total(), raising ValueError if M has zero cohomology.
+
+        Rather than computing M.total(), we look for cohomology in the
+        lowest degree of any M[X], then the next lowest and so on,
+        stopping as soon as we find some; likewise downwards from the
+        highest degree. The graded pieces of M.mu(X) in between are
+        only eliminated if they are needed, and each one at most once.
+        A degree in which dim M[X]_n > dim M[X]_{n-1} + dim M[X]_{n+1}
+        must carry cohomology, so needs no elimination at all. The
+        options are passed on to M.ker_im.
+        '''
+        A,M=self.cat,self
+        pieces={X: M[X].graded_pieces for X in A.objects}
+        dims={X: M[X].gr_dim for X in A.objects}
+        ranks={}     # {(X,n): (nullity,rank) of M.mu(X) on M[X]_n}
+
+        def ker_im(X,n):
+            if (X,n) not in ranks:
+                ranks[(X,n)]=M.ker_im(X,n,method,primes)
+            return ranks[(X,n)]
+
+        def nonzero(X,n):
+            '''Returns True if H^n(M[X],mu^1) is nonzero.'''
+            if n not in pieces[X]:
+                return False
+            if dims[X][n]>dims[X].get(n-1,0)+dims[X].get(n+1,0):
+                return True
+            kernel=ker_im(X,n)[0]
+            if kernel==0 or n-1 not in pieces[X]:
+                return kernel>0
+            return kernel>ker_im(X,n-1)[1]
+
+        degrees=sorted(set().union(*pieces.values()))
+        low=next((n for n in degrees
+                  if any(nonzero(X,n) for X in A.objects)),None)
+        if low is None:
+            raise ValueError('The module has zero cohomology')
+        high=next(n for n in reversed(degrees)
+                  if any(nonzero(X,n) for X in A.objects))
+        return low,high
 
     def shift(self,m=1):
         '''Returns the A_\infty module shifted in degree by m.'''
@@ -698,37 +1359,39 @@ class A8Module(AlgebraicStructure):
                 operations.update({word: new_op})
         return A8Module(A,modules,operations)
 
-    def oplus(self,other):
-        '''Returns the module which is the direct sum of self and other.'''
+    def oplus(self,other,lazy=False):
+        '''Returns the module which is the direct sum of self and other,
+        with its vector spaces indexed by integers. If lazy=True, each
+        operation is only computed when it is asked for (see
+        LazyOperations).'''
         (M,N)=(self,other)
         A=M.cat
-        new_modules={X: M[X].oplus(N[X])
-                     for X in ChainMap(M.modules,N.modules)}
-        new_operations={}
-        all_keys=ChainMap(M.operations,N.operations)
+        S=A8Module(A,{},LazyOperations() if lazy else {})
+        translators={}
+        for X in ChainMap(M.modules,N.modules):
+            S.modules[X],translators[X]=VectorSpace.indexed_sum(M[X],N[X])
         zeroNM=A8ModuleMap(N,M,0,{})
         zeroMN=A8ModuleMap(M,N,0,{})
-        new_operations.update({word:
-                               LinearMap.block(
-                                   M.mu(*word),zeroNM.cpt(*word),
-                                   zeroMN.cpt(*word),N.mu(*word))
-                               for word in all_keys
-                               if len(word)==1})
-        new_operations.update({word:
-                               LinearMap.block(
-                                   M.mu(*word),zeroNM.cpt(*word),
-                                   zeroMN.cpt(*word),N.mu(*word))
-                               .flatten(1).unflatten(0,2)
-                               for word in all_keys
-                               if len(word)>1})
-        new_a8mod=A8Module(A,new_modules,new_operations)
-        return new_a8mod
+
+        def build(word):
+            return LinearMap.indexed_block(
+                M.mu(*word),zeroNM.cpt(*word),zeroMN.cpt(*word),N.mu(*word),
+                S.domain(*word),S[word[0]],
+                translators[word[-1]],translators[word[0]],
+                head=len(word)>1)
+
+        for word in ChainMap(M.operations,N.operations):
+            if lazy:
+                S.operations.defer(word,lambda word=word: build(word))
+            else:
+                S.operations[word]=build(word)
+        return S
         
     
-    def twist(self,X):
+    def twist(self,X,reduce=False,lazy=False):
         '''Returns the twist of the module M around the object X.
 
-        This is obtained in several steps:
+        Mathematically, this is obtained in several steps:
         1. We form
             (a) the Yoneda module  Y = yoneda(X)
             (b) the chain complex  Z = (M(X), \mu^1)
@@ -738,19 +1401,220 @@ class A8Module(AlgebraicStructure):
             ev^d(c(x)b,a_{d-1},...,a_1) = \mu^{d+1}_M(c,b,a_{d-1},...,a_1)
         
         3. We return the cone on ev.
+
+        Rather than building T, ev and the cone one after another (see
+        CochainComplex.otimes and A8ModuleMap.cone), we write each
+        column of the cone straight into its integer-indexed module
+        (see TwistColumns). The result is the same as ev.cone().
+
+        If reduce=True then we return the minimal model of the cone
+        instead, so that repeated twists act on modules whose size
+        is bounded by the dimensions of their Ext-groups.
+
+        If lazy=True then each operation of the cone is only computed
+        when it is asked for (see LazyOperations), reading only the
+        operations of M which it needs. For example, C.total() only
+        needs C.mu(W), which needs M.mu(W) and M.mu(W,X). Until all
+        of its operations have been computed, C keeps M alive.
         '''
-        Y=self.cat.yoneda(X)
-        Z=self.cpx(X)
-        T=Z.otimes(Y)
-        new_cpts={}
-        new_cpts.update({word[:-1]: self.mu(*word)
-                         for word in self.operations
-                         if word[-1]==X and len(word)==2})
-        new_cpts.update({word[:-1]: self.mu(*word).unflatten(0,2)
-                         for word in self.operations
-                         if word[-1]==X and len(word)>2})
-        ev=A8ModuleMap(T,self,0,new_cpts)
-        return ev.cone().simplify()
+        M=self
+        B=TwistColumns(M,X,LazyOperations() if lazy else {})
+        C=B.C
+        for word in B.words():
+            if lazy:
+                C.operations.defer(word,lambda word=word: B.build(word))
+            else:
+                C.operations[word]=B.build(word)
+        if reduce:
+            return C.minimal_model()
+        # A weak reference, so that a chain of twists does not keep all
+        # of its modules alive.
+        C.parent=(weakref.ref(M),B.starts)
+        return C
+
+class TwistColumns():
+    '''The columns of the operations of a twist (see A8Module.twist),
+    sorted by where they come from.
+
+    USAGE:
+
+        B=TwistColumns(M,X,operations)
+
+    lays out the underlying spaces of the twist C=B.C of the module M
+    around the object X (with the given empty dictionary of
+    operations), and B.build(word) returns the operation of C for
+    word. Write Y=yoneda(X) and Z=M(X). The basis element z(x)b of
+    Z (x) Y[W] has the index pos(z)*dim Y[W]+pos(b) in C[W], and
+    these are followed by the basis of M[W].
+
+    Each operation of C is made of three blocks of columns, which
+    are computed separately (so that profiling.Profiler can time
+    them).
+
+    ATTRIBUTES:
+
+        B.module [A8Module]
+
+            The module M.
+
+        B.C [A8Module]
+
+            The twist.
+
+        B.starts [dict] {W: int}
+
+            The index in C[W] of the first basis element of M[W].
+
+    METHODS:
+
+        B.differential_columns(word)
+
+            Returns the columns of the operation of the tensor product
+            Z (x) Y for word (Id (x) \mu_Y + d (x) sigma if word has
+            length one and Id (x) \mu_Y otherwise).
+
+        B.evaluation_columns(word)
+
+            Returns the columns of the evaluation map ev for word.
+
+        B.operation_columns(word)
+
+            Returns the columns of the operation of M for word.
+
+        B.build(word)
+
+            Returns the operation of C for word.
+
+        B.words()
+
+            Returns the words for which C has an operation.
+
+    Columns are returned as dictionaries {column index: {row index:
+    number}}, indexed as in C.
+    '''
+    def __init__(self,M,X,operations):
+        A=M.cat
+        self.module=M
+        self.Y=A.yoneda(X)
+        self.Z,self.d=M[X],M.mu(X)
+        self.z_pos={z: n for n,z in enumerate(self.Z.basis)}
+        self.C=A8Module(A,{},operations)
+        self.y_pos={}     # {W: {b: position of b in Y[W].basis}}
+        self.m_pos={}     # {W: {m: index of m in C[W]}}
+        self.starts={}
+        for W in ChainMap(self.Y.modules,M.modules):
+            V=VectorSpace(A.field)
+            V.basis.update(enumerate(g+h-1 for g in self.Z.basis.values()
+                                     for h in self.Y[W].basis.values()))
+            start=len(V.basis)
+            self.starts[W]=start
+            self.m_pos[W]={m: start+n for n,m in enumerate(M[W].basis)}
+            V.basis.update(zip(self.m_pos[W].values(),M[W].basis.values()))
+            self.y_pos[W]={b: n for n,b in enumerate(self.Y[W].basis)}
+            self.C.modules[W]=V
+        self.ev_words={word[:-1]: word for word in M.operations
+                       if word[-1]==X and len(word)>1}
+        self.t_words={(W,): None for W in self.Y.modules}
+        self.t_words.update({word: None for word in self.Y.operations
+                             if len(word)>1})
+
+    def words(self):
+        '''Returns the words for which the twist has an operation.'''
+        return ChainMap(self.ev_words,self.t_words,self.module.operations)
+
+    def t_index(self,W,z,b):
+        '''Returns the index of z (x) b in C[W].'''
+        return self.z_pos[z]*len(self.y_pos[W])+self.y_pos[W][b]
+
+    def t_column(self,W0,z,v):
+        '''Returns the components of z (x) v in C[W0].'''
+        offset=self.z_pos[z]*len(self.y_pos[W0])
+        return {offset+self.y_pos[W0][b]: x for b,x in v.components.items()}
+
+    def differential(self,W):
+        '''Yields (z,b,v) for the nonzero values v of the
+        differential Id (x) \mu_Y + d (x) sigma of T[W], as vectors
+        in T[W].'''
+        Y,Z,d=self.Y,self.Z,self.d
+        T_W=Z.otimes(Y[W])
+        mu_Y=Y.mu(W)
+        odd={b: g%2 for b,g in Y[W].basis.items()}
+        keys=ChainMap({(z,b): None for z in Z.basis
+                       for b,v in mu_Y.maps.items() if v.components},
+                      {(z,b): None for z,v in d.maps.items()
+                       if v.components for b in Y[W].basis})
+        for z,b in keys:
+            first=Vector(T_W,{})
+            if b in mu_Y.maps:
+                first=Vector(T_W,{(z,c): x for c,x
+                                  in mu_Y.maps[b].components.items()})
+            second=Vector(T_W,{})
+            if z in d.maps:
+                second=Vector(T_W,{(y,b): (x if odd[b] else -x) for y,x
+                                   in d.maps[z].components.items()})
+            v=first+second
+            if v.components:
+                yield z,b,v
+
+    def differential_columns(self,word):
+        '''Returns the columns of the operation of Z (x) Y for word.'''
+        cols={}
+        if word not in self.t_words:
+            return cols
+        W0,W=word[0],word[-1]
+        if len(word)==1:
+            for z,b,v in self.differential(W):
+                cols[self.t_index(W,z,b)]={self.t_index(W0,y,c): x
+                                           for (y,c),x in v.components.items()}
+        else:
+            values=[(key,v) for key,v in self.Y.mu(*word).maps.items()
+                    if v.components]
+            for z in self.Z.basis:
+                for key,v in values:
+                    cols[(self.t_index(W,z,key[0]),)+key[1:]]=self.t_column(W0,z,v)
+        return cols
+
+    def evaluation_columns(self,word):
+        '''Returns the columns of the evaluation map for word.'''
+        cols={}
+        if word not in self.ev_words:
+            return cols
+        W0,W=word[0],word[-1]
+        m_pos=self.m_pos[W0]
+        for key,v in self.module.mu(*self.ev_words[word]).maps.items():
+            i=self.t_index(W,key[0],key[1])
+            if len(word)>1:
+                i=(i,)+key[2:]
+            cols[i]={m_pos[m]: x for m,x in v.components.items()}
+        return cols
+
+    def operation_columns(self,word):
+        '''Returns the columns of the operation of M for word.'''
+        W0,W=word[0],word[-1]
+        m_pos=self.m_pos[W0]
+        cols={}
+        for key,v in self.module.mu(*word).maps.items():
+            if len(word)==1:
+                i=self.m_pos[W][key]
+            else:
+                i=(self.m_pos[W][key[0]],)+key[1:]
+            cols[i]={m_pos[n]: x for n,x in v.components.items()}
+        return cols
+
+    def build(self,word):
+        '''Returns the operation of the twist for word.'''
+        C=self.C
+        W0=word[0]
+        E=LinearMap(C.domain(*word),C[W0],2-len(word))
+        t_cols=self.differential_columns(word)
+        ev_cols=self.evaluation_columns(word)
+        m_cols=self.operation_columns(word)
+        for i in ChainMap(t_cols,ev_cols):
+            cpts=dict(t_cols.get(i,{}))
+            cpts.update(ev_cols.get(i,{}))
+            E.maps[i]=Vector(C[W0],cpts)
+        E.maps.update({i: Vector(C[W0],cpts) for i,cpts in m_cols.items()})
+        return E
 
 class A8ModuleMap(AlgebraicStructure):
     '''The class of A_\infty pre-module homomorphisms.
@@ -817,7 +1681,7 @@ class A8ModuleMap(AlgebraicStructure):
         if word in self.components:
             return self.components[word]
         else:
-            cpt_source=self.source.mu(*word).source
+            cpt_source=self.source.domain(*word)
             cpt_target=self.target[word[0]]
             return LinearMap(cpt_source,cpt_target,1+self.deg-len(word))
 
@@ -831,7 +1695,7 @@ class A8ModuleMap(AlgebraicStructure):
                 print('M(',word[-1],') * A.hom(',word,') = ')
             self.components[word].display()
         
-    def cone(self):
+    def cone(self,lazy=False):
         '''Returns the cone on an A_\infty pre-module morphism.
 
         The modules for the cone are
@@ -841,29 +1705,38 @@ class A8ModuleMap(AlgebraicStructure):
             (\mu_M  0    )
             (F      \mu_N)
 
-        but F and \mu_M need to be suitably shifted
-        (using rejig_*) to make sense and some flattening/
-        unflattening is needed to get the bases to match up.
+        (F and \mu_M are shifted, but with m=1 rejig_2 and
+        rejig_3 do not change any components). The modules C(X)
+        are indexed by integers from the start, using
+        VectorSpace.indexed_sum, and the operations are built with
+        LinearMap.indexed_block, so no flattening, unflattening or
+        re-indexing is needed afterwards.
+
+        If lazy=True, each operation is only computed when it is asked
+        for (see LazyOperations).
         '''
         (M,N)=(self.source,self.target)
         A=M.cat
-        new_modules={X: M[X].shift().oplus(N[X])
-                     for X in ChainMap(M.modules,N.modules)}
-        new_operations={}
+        C=A8Module(A,{},LazyOperations() if lazy else {})
+        translators={}
+        for X in ChainMap(M.modules,N.modules):
+            C.modules[X],translators[X]=VectorSpace.indexed_sum(M[X].shift(),N[X])
         all_keys=ChainMap(self.components,M.operations,N.operations)
-        zero=A8ModuleMap(N,M.shift(),1,{})
-        new_operations.update({word:
-                               LinearMap.block(
-                                   M.mu(*word).rejig_2(),zero.cpt(*word),
-                                   self.cpt(*word).rejig_3(),N.mu(*word))
-                               for word in all_keys
-                               if len(word)==1})
-        new_operations.update({word:
-                               LinearMap.block(
-                                   M.mu(*word).rejig_2(),zero.cpt(*word),
-                                   self.cpt(*word).rejig_3(),N.mu(*word))
-                               .flatten(1).unflatten(0,2)
-                               for word in all_keys
-                               if len(word)>1})
-        new_a8mod=A8Module(A,new_modules,new_operations)
-        return new_a8mod
+        # Only the (empty) components of the zero map are read, so there
+        # is no need to shift M.
+        zero=A8ModuleMap(N,M,1,{})
+
+        def build(word):
+            return LinearMap.indexed_block(
+                M.mu(*word),zero.cpt(*word),self.cpt(*word),N.mu(*word),
+                C.domain(*word),C[word[0]],
+                translators[word[-1]],translators[word[0]],
+                head=len(word)>1)
+
+        for word in all_keys:
+            if lazy:
+                C.operations.defer(word,lambda word=word: build(word))
+            else:
+                C.operations[word]=build(word)
+        return C
+
@@ -28,3 +28,37 @@ def gcd(a,b):
     p, q, r = extendedEuclideanAlgorithm(a,b)
     return abs(r)
 
+
+def is_prime(n):
+    '''Tests whether an integer n is prime, using the Miller-Rabin test
+    with enough bases to be deterministic for n < 3*10^24.'''
+    if n<2:
+        return False
+    bases=(2,3,5,7,11,13,17,19,23,29,31,37,41)
+    for p in bases:
+        if n%p==0:
+            return n==p
+    d,s=n-1,0
+    while d%2==0:
+        d,s=d//2,s+1
+    for a in bases:
+        x=pow(a,d,n)
+        if x==1 or x==n-1:
+            continue
+        for _ in range(s-1):
+            x=x*x%n
+            if x==n-1:
+                break
+        else:
+            return False
+    return True
+
+def word_primes(start=2**30):
+    '''Generates the primes below start, in decreasing order. These fit
+    in a machine word (in fact in a single digit of a Python integer)
+    so arithmetic modulo them is fast.'''
+    n=start-1
+    while n>1:
+        if is_prime(n):
+            yield n
+        n-=1
@@ -0,0 +1,196 @@
+#!/usr/bin/python
+
+# A benchmark suite for the twist/cohomology pipeline.
+#
+# Usage:
+#
+#     python benchmarks.py [--quick] [--only SUBSTRING] [--repeat N]
+#                          [--output FILE] [--baseline FILE]
+#
+# Each named scenario is run (over each of the fields FF(2), FF(3)
+# and QQ) and we report the wall time, the peak memory allocated
+# while it ran and the number of Python objects it left alive (the
+# size of its result). Memory is measured in a separate run, so that
+# tracing allocations does not slow down the timed runs. The results can be written out as JSON and
+# compared against a JSON file produced by an earlier run.
+
+import argparse
+import gc
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+import finite_fields as ff
+import rationals as QQ
+import a_infinity as ainf
+from linear_algebra import *
+
+FIELDS={'FF2': lambda: ff.FF(2),'FF3': lambda: ff.FF(3),'QQ': lambda: QQ.QQ()}
+
+SCENARIOS={}
+
+def scenario(name,quick=True):
+    '''Registers a scenario. The decorated function takes a field K and
+    returns a function of no arguments which performs the stage being
+    measured (anything done before that is setup, and is not
+    measured). Scenarios with quick=False are skipped by --quick.'''
+    def register(setup):
+        SCENARIOS[name]=(setup,quick)
+        return setup
+    return register
+
+def twist_along(M,word,reduce=False):
+    for X in word:
+        M=M.twist(X,reduce)
+    return M
+
+for p in (3,4,5,6):
+    @scenario('bp_construction_%d' % p,quick=p<5)
+    def bp_construction(K,p=p):
+        return lambda: ainf.BP(p,2,K,3,1)
+
+@scenario('yoneda')
+def yoneda(K):
+    A=ainf.BP(5,2,K,3,1)
+    return lambda: [A.yoneda(X) for X in sorted(A.objects)]
+
+@scenario('total_yoneda')
+def total_yoneda(K):
+    A=ainf.BP(5,2,K,3,1)
+    return lambda: A.total_yoneda()
+
+for n in (1,2,3,4,5):
+    @scenario('twist_chain_%d' % n,quick=n<4)
+    def twist_chain(K,n=n):
+        A=ainf.BP(4,2,K,3,1)
+        M=A.total_yoneda()
+        word=[1,2,3,1,2][:n]
+        return lambda: twist_along(M,word)
+
+@scenario('twist_chain_reduced_5')
+def twist_chain_reduced(K):
+    A=ainf.BP(4,2,K,3,1)
+    M=A.total_yoneda()
+    return lambda: twist_along(M,[1,2,3,1,2],reduce=True)
+
+@scenario('total_width')
+def total_width(K):
+    A=ainf.BP(4,2,K,3,1)
+    M=twist_along(A.total_yoneda(),[1,2,3,1])
+    return lambda: (M.total(),M.width())
+
+@scenario('ker_im_random_sparse')
+def ker_im_random_sparse(K,n=300,per_column=4):
+    rng=random.Random(0)
+    V=VectorSpace(K).build({0: n})
+    W=VectorSpace(K).build({1: n})
+    F=LinearMap(V,W,1)
+    for i in range(n):
+        F.maps[i]=Vector(W,{rng.randrange(n): K(rng.randint(1,5))
+                            for _ in range(per_column)}).chomp()
+    # Make a third of the columns dependent on the others.
+    for i in range(n//3):
+        F.maps[i]=F[n-1-i]+F[n-2-i]
+    return lambda: F.ker_im()
+
+@scenario('verify')
+def verify(K):
+    A=ainf.BP(5,2,K,3,1)
+    return lambda: A.verify()
+
+def measure(run,repeat=1):
+    '''Runs run() repeat times and returns a dictionary with the best
+    wall time (in seconds), the peak of memory allocated (in KiB) and
+    the number of objects kept alive by the result.
+
+    Tracing allocations with tracemalloc slows the code down (and not
+    evenly), so the times are taken with it switched off; the memory
+    and objects are measured in one more run, made first, with it
+    switched on.'''
+    gc.collect()
+    before=len(gc.get_objects())
+    tracemalloc.start()
+    result=run()
+    peak=tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    gc.collect()
+    objects=len(gc.get_objects())-before
+    del result
+    best=None
+    for _ in range(repeat):
+        gc.collect()
+        start=time.perf_counter()
+        result=run()
+        elapsed=time.perf_counter()-start
+        del result
+        best=elapsed if best is None else min(best,elapsed)
+    return {'time': best,'peak_kib': peak/1024,'objects': objects}
+
+def run_suite(quick=False,only=None,repeat=1,fields=None):
+    '''Runs the benchmarks and returns a dictionary of results indexed
+    by 'scenario/field'.'''
+    results={}
+    for name,(setup,is_quick) in SCENARIOS.items():
+        if (quick and not is_quick) or (only and only not in name):
+            continue
+        for field_name in (fields or FIELDS):
+            K=FIELDS[field_name]()
+            key='%s/%s' % (name,field_name)
+            results[key]=measure(setup(K),repeat)
+            print('%-36s %9.4fs %10.1f KiB %9d objects'
+                  % (key,results[key]['time'],results[key]['peak_kib'],
+                     results[key]['objects']))
+    return results
+
+def compare(results,baseline,threshold=1.25):
+    '''Prints the ratio of each result to the baseline and returns the
+    list of benchmarks whose time or peak memory grew by more than the
+    given factor.'''
+    regressions=[]
+    for key in sorted(results):
+        if key not in baseline:
+            continue
+        old,new=baseline[key],results[key]
+        ratios={stat: new[stat]/old[stat] if old[stat] else 1.0
+                for stat in ('time','peak_kib')}
+        flag=''
+        if max(ratios.values())>threshold:
+            regressions.append(key)
+            flag='  <-- regression'
+        print('%-36s time x%.2f  memory x%.2f%s'
+              % (key,ratios['time'],ratios['peak_kib'],flag))
+    return regressions
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(description='Benchmark the twist/cohomology pipeline.')
+    parser.add_argument('--quick',action='store_true',
+                        help='skip the slowest scenarios')
+    parser.add_argument('--only',help='only run scenarios whose name contains this')
+    parser.add_argument('--field',action='append',choices=sorted(FIELDS),
+                        help='only run over this field (may be repeated)')
+    parser.add_argument('--repeat',type=int,default=1,
+                        help='run each scenario this many times and keep the best time')
+    parser.add_argument('--output',help='write the results to this JSON file')
+    parser.add_argument('--baseline',help='compare against this JSON file')
+    parser.add_argument('--threshold',type=float,default=1.25,
+                        help='ratio above which a change counts as a regression')
+    args=parser.parse_args(argv)
+
+    results=run_suite(args.quick,args.only,args.repeat,args.field)
+    if args.output:
+        with open(args.output,'w') as f:
+            json.dump({'python': platform.python_version(),
+                       'platform': platform.platform(),
+                       'results': results},f,indent=1,sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline=json.load(f)['results']
+        if compare(results,baseline,args.threshold):
+            return 1
+    return 0
+
+if __name__=='__main__':
+    sys.exit(main())
@@ -0,0 +1,188 @@
+#!/usr/bin/python
+
+# Braid words. Twists around spherical objects satisfy the braid
+# relations up to quasi-isomorphism (Seidel-Thomas): if hom(X,Y)=0
+# then twisting around X and Y in either order gives the same module,
+# and if hom(X,Y) is one-dimensional then twisting along (X,Y,X) and
+# along (Y,X,Y) does. So the twists of a module along two words which
+# are equal in the braid monoid have the same total Ext-group and
+# width, and a search through words only needs to twist along one
+# word from each class.
+#
+# The relations preserve length, so each class is finite, and we take
+# the lexicographically smallest word in a class as its normal form.
+# A prefix of a normal form is again a normal form (if u~u' with u'<u
+# then uv~u'v<uv), so the normal forms make up a tree: each one is a
+# normal form with one more letter on the end, and they can be listed
+# by only ever extending normal forms.
+#
+# To test whether a word is a normal form we do not need its class.
+# The monoid is cancellative, so the smallest word for an element g
+# starts with the smallest letter which left-divides g, followed by
+# the smallest word for the quotient. A word is therefore a normal
+# form if and only if, for each of its suffixes, no letter smaller
+# than its first letter left-divides it. Whether a letter A
+# left-divides the element of a word YW (A!=Y) is read off from the
+# relation between A and Y: if they commute, A must left-divide W;
+# if AYA=YAY, the word AY must left-divide W; otherwise it cannot.
+
+class BraidMonoid():
+    '''The positive braid monoid on a set of objects.
+
+    USAGE:
+
+        B=BraidMonoid(objects,relations)
+
+    where relations is a dictionary {(X,Y): m} with m=2 if X and Y
+    commute and m=3 if XYX=YXY; pairs which are missing satisfy no
+    relation. Usually B is made from an A_\\infty-category of
+    spherical objects, e.g. B=BraidMonoid.from_category(BP(p,q,K,N,d)),
+    or from a DynkinGraph.
+
+    Words are tuples of objects. Words are compared lexicographically,
+    with the objects in sorted order.
+
+    ATTRIBUTES:
+
+        B.objects [list]
+
+            The objects, in sorted order.
+
+        B.relations [dict] {(X,Y): 2 or 3}
+
+    METHODS:
+
+        B.equivalent_words(word)
+
+            Returns the set of all words equal to word in B.
+
+        B.normal_form(word)
+
+            Returns the smallest word equal to word in B.
+
+        B.is_normal(word)
+
+            Returns True if word is its own normal form.
+
+        B.left_quotient(prefix,word)
+
+            Returns a word w with prefix+w equal to word in B, or None
+            if there is none.
+
+        B.words(depth)
+
+            Yields the normal forms of length at most depth, shortest
+            first and in lexicographic order within each length.
+    '''
+    def __init__(self,objects,relations):
+        self.objects=sorted(objects)
+        self.relations=relations
+        self.order={X: n for n,X in enumerate(self.objects)}
+
+    @staticmethod
+    def from_category(A):
+        '''Returns the braid monoid of the twists around the objects of
+        A, which should all be spherical: X and Y commute if
+        hom(X,Y)=hom(Y,X)=0 and satisfy the braid relation if these
+        are at most one-dimensional.'''
+        relations={}
+        for X in A.objects:
+            for Y in A.objects:
+                if X!=Y:
+                    n=max(len(A[(X,Y)].basis),len(A[(Y,X)].basis))
+                    if n<=1:
+                        relations[(X,Y)]=n+2
+        return BraidMonoid(A.objects,relations)
+
+    @staticmethod
+    def from_graph(G):
+        '''Returns the braid monoid of the DynkinGraph G: two vertices
+        satisfy the braid relation if they are joined by an arrow, and
+        commute otherwise.'''
+        relations={}
+        for X in G.vertices:
+            for Y in G.vertices:
+                if X!=Y:
+                    joined=Y in G.arrows.get(X,{}) or X in G.arrows.get(Y,{})
+                    relations[(X,Y)]=3 if joined else 2
+        return BraidMonoid(G.vertices,relations)
+
+    def key(self,word):
+        '''Returns the sort key of word.'''
+        return tuple(self.order[X] for X in word)
+
+    def moves(self,word):
+        '''Yields the words obtained from word by applying one relation.'''
+        for i in range(len(word)-1):
+            X,Y=word[i],word[i+1]
+            if X==Y:
+                continue
+            m=self.relations.get((X,Y))
+            if m==2:
+                yield word[:i]+(Y,X)+word[i+2:]
+            elif m==3 and i+2<len(word) and word[i+2]==X:
+                yield word[:i]+(Y,X,Y)+word[i+3:]
+
+    def equivalent_words(self,word):
+        '''Returns the set of words equal to word in B.'''
+        word=tuple(word)
+        seen={word}
+        todo=[word]
+        while todo:
+            for new_word in self.moves(todo.pop()):
+                if new_word not in seen:
+                    seen.add(new_word)
+                    todo.append(new_word)
+        return seen
+
+    def normal_form(self,word):
+        '''Returns the lexicographically smallest word equal to word.'''
+        return min(self.equivalent_words(word),key=self.key)
+
+    def left_quotient(self,prefix,word):
+        '''Returns a word w such that prefix+w is equal to word in B, or
+        None if prefix does not left-divide word.'''
+        word=tuple(word)
+        for A in prefix:
+            word=self.divide(A,word)
+            if word is None:
+                return None
+        return word
+
+    def divide(self,A,word):
+        '''Returns a word w such that (A,)+w is equal to word in B, or
+        None if the letter A does not left-divide word.'''
+        if not word:
+            return None
+        Y,rest=word[0],word[1:]
+        if Y==A:
+            return rest
+        m=self.relations.get((A,Y))
+        if m==2:
+            # YW=AW' if W=AW', and then W'=YW'.
+            rest=self.divide(A,rest)
+            return None if rest is None else (Y,)+rest
+        elif m==3:
+            # YW is a multiple of AYA=YAY if W=AYW', and then YW=AYAW'.
+            rest=self.left_quotient((A,Y),rest)
+            return None if rest is None else (Y,A)+rest
+        return None
+
+    def is_normal(self,word):
+        '''Returns True if no word equal to word is smaller than it.'''
+        word=tuple(word)
+        for i,X in enumerate(word):
+            suffix=word[i:]
+            for A in self.objects[:self.order[X]]:
+                if self.divide(A,suffix) is not None:
+                    return False
+        return True
+
+    def words(self,depth):
+        '''Yields the normal forms of length at most depth.'''
+        level=[()]
+        for n in range(depth+1):
+            yield from level
+            if n<depth:
+                level=[word+(X,) for word in level for X in self.objects
+                       if self.is_normal(word+(X,))]
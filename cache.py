@@ -0,0 +1,173 @@
+#!/usr/bin/python
+
+# A cache for twists of A_\infty-modules. Many computations twist the
+# same module around the same object over and over again (the same
+# prefix of a braid word in different runs, or different words which
+# happen to give the same module), so we remember the results, keyed
+# by a fingerprint of the module and the object.
+
+from collections import OrderedDict
+import hashlib
+import os
+import pickle
+import weakref
+
+def _digest(parts):
+    '''Returns the sha256 hex digest of an iterable of strings.'''
+    h=hashlib.sha256()
+    for part in parts:
+        h.update(part.encode())
+        h.update(b'\0')
+    return h.hexdigest()
+
+def _map_parts(F):
+    '''Yields strings describing the nonzero entries of a linear map, in
+    a canonical order.'''
+    for i in sorted(F.maps,key=repr):
+        for j,x in sorted(F.maps[i].components.items(),key=repr):
+            if x!=0:
+                yield '%r %r %s' % (i,j,x)
+
+def category_fingerprint(A):
+    '''Returns a fingerprint (a hex string) of the A_\\infty-category A:
+    two categories with the same fingerprint have the same field,
+    objects, morphism spaces and operations.'''
+    def parts():
+        yield 'field %s %s' % (A.field.char,A.field.order)
+        yield 'objects %r' % sorted(A.objects,key=repr)
+        for pair in sorted(A.morphisms,key=repr):
+            yield 'hom %r %r' % (pair,sorted(A[pair].basis.items(),key=repr))
+        for word in sorted(A.operations,key=repr):
+            yield 'mu %r' % (word,)
+            yield from _map_parts(A.mu(*word))
+    return _digest(parts())
+
+def module_fingerprint(M,category=None):
+    '''Returns a fingerprint (a hex string) of the A_\\infty-module M,
+    computed from M.simplify() so that it does not depend on how the
+    bases of M are labelled (only on their order). The fingerprint of
+    M.cat can be passed in if it is already known.'''
+    if category is None:
+        category=category_fingerprint(M.cat)
+    N=M.simplify()
+    def parts():
+        yield 'category '+category
+        for X in sorted(N.modules,key=repr):
+            yield 'module %r %r' % (X,[N[X].basis[i] for i in sorted(N[X].basis)])
+        for word in sorted(N.operations,key=repr):
+            yield 'mu %r' % (word,)
+            yield from _map_parts(N.mu(*word))
+    return _digest(parts())
+
+class TwistCache():
+    '''A cache for A8Module.twist and A8Category.yoneda.
+
+    USAGE:
+
+        C=TwistCache(maxsize=128,directory=None)
+
+    creates a cache which keeps at most maxsize modules in memory,
+    evicting the least recently used. If directory is given, every
+    module computed is also written there (as a pickle named by its
+    key), and modules evicted from memory (or computed by earlier
+    runs) are read back from disk instead of being recomputed.
+
+        C.twist(M,X,reduce=False)
+        C.yoneda(A,X)
+
+    return the same as M.twist(X,reduce) and A.yoneda(X) but look in
+    the cache first. The modules returned are shared with the cache,
+    so should not be modified.
+
+    ATTRIBUTES:
+
+        C.hits, C.disk_hits, C.misses [int]
+
+            The number of lookups answered from memory, answered from
+            disk, and computed from scratch.
+
+    METHODS:
+
+        C.stats()
+
+            Returns a dictionary of the counters above, together with
+            the number of modules currently held in memory.
+
+        C.clear()
+
+            Empties the in-memory tier (the disk tier is untouched).
+    '''
+    def __init__(self,maxsize=128,directory=None):
+        self.maxsize=maxsize
+        self.directory=directory
+        if directory is not None:
+            os.makedirs(directory,exist_ok=True)
+        self.entries=OrderedDict()
+        self.hits=0
+        self.disk_hits=0
+        self.misses=0
+        self.fingerprints=weakref.WeakKeyDictionary()
+        self.category_fingerprints=weakref.WeakKeyDictionary()
+
+    def category_fingerprint(self,A):
+        '''Returns category_fingerprint(A), remembering it for next time.'''
+        if A not in self.category_fingerprints:
+            self.category_fingerprints[A]=category_fingerprint(A)
+        return self.category_fingerprints[A]
+
+    def fingerprint(self,M):
+        '''Returns module_fingerprint(M), remembering it for next time.'''
+        if M not in self.fingerprints:
+            self.fingerprints[M]=module_fingerprint(
+                M,self.category_fingerprint(M.cat))
+        return self.fingerprints[M]
+
+    def path(self,key):
+        '''Returns the file in which the disk tier stores key.'''
+        return os.path.join(self.directory,key+'.pickle')
+
+    def lookup(self,key,compute):
+        '''Returns the value stored under key, calling compute() to
+        produce it (and storing it) if it is not in the cache.'''
+        if key in self.entries:
+            self.hits+=1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        value=None
+        if self.directory is not None and os.path.exists(self.path(key)):
+            with open(self.path(key),'rb') as f:
+                value=pickle.load(f)
+            self.disk_hits+=1
+        if value is None:
+            self.misses+=1
+            value=compute()
+            if self.directory is not None:
+                # Write to a temporary file first so that an interrupted
+                # run never leaves a truncated pickle behind.
+                tmp=self.path(key)+'.%d.tmp' % os.getpid()
+                with open(tmp,'wb') as f:
+                    pickle.dump(value,f,protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp,self.path(key))
+        self.entries[key]=value
+        while len(self.entries)>self.maxsize:
+            self.entries.popitem(last=False)
+        return value
+
+    def twist(self,M,X,reduce=False):
+        '''Returns M.twist(X,reduce), using the cache.'''
+        key=_digest(['twist',self.fingerprint(M),repr(X),repr(reduce)])
+        return self.lookup(key,lambda: M.twist(X,reduce))
+
+    def yoneda(self,A,X):
+        '''Returns A.yoneda(X), using the cache.'''
+        key=_digest(['yoneda',self.category_fingerprint(A),repr(X)])
+        return self.lookup(key,lambda: A.yoneda(X))
+
+    def stats(self):
+        '''Returns a dictionary of hit/miss counters.'''
+        return {'hits': self.hits,'disk_hits': self.disk_hits,
+                'misses': self.misses,'size': len(self.entries)}
+
+    def clear(self):
+        '''Empties the in-memory tier of the cache.'''
+        self.entries.clear()
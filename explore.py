@@ -0,0 +1,97 @@
+#!/usr/bin/python
+
+# Routines for exploring the tree of braid words: starting from an
+# A_\infty-module M, we twist M around every word in the objects of
+# the underlying category (up to a given length) and report the
+# total Ext-group of each twisted module.
+#
+# The words form a tree (the children of w are w+(X,) for each
+# object X) and each module is computed once from its parent. The
+# top of the tree is computed in the calling process; once there are
+# enough nodes, the subtrees below them are handed out to a pool of
+# worker processes, which explore them depth-first.
+#
+# Given a braids.BraidMonoid, only the words in braid normal form are
+# explored: these form a subtree (see braids.py), and the twist along
+# any other word has the same cohomology as the twist along its
+# normal form.
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
+
+def report(word,M):
+    '''Returns the 3-tuple (word,M.total(),M.width()), with width None
+    if the module has zero cohomology.'''
+    total=M.total()
+    if total:
+        return word,total,(min(total),max(total))
+    else:
+        return word,total,None
+
+def children(word,objects,braids=None):
+    '''Returns the words word+(X,) for X in objects, keeping only
+    those in normal form if braids (a BraidMonoid) is given.'''
+    words=[word+(X,) for X in objects]
+    if braids is None:
+        return words
+    return [w for w in words if braids.is_normal(w)]
+
+def subtree(M,word,depth,objects,reduce=False,braids=None):
+    '''Returns the list of reports for the module M (which is the
+    twist along word) and all of its twists along words of length at
+    most depth which extend word. The tree is explored depth-first so
+    that only the modules along the current branch are kept.'''
+    results=[report(word,M)]
+    if len(word)<depth:
+        for w in children(word,objects,braids):
+            results.extend(subtree(M.twist(w[-1],reduce),w,
+                                   depth,objects,reduce,braids))
+    return results
+
+def explore(M,depth,objects=None,max_workers=None,reduce=False,split=None,
+            braids=None):
+    '''Twists the module M along every word of length at most depth in
+    the given objects (by default all objects of M.cat, in sorted
+    order) and yields the 3-tuples
+
+        (word, total, width)
+
+    where total=M_w.total() and width=(min degree, max degree) of
+    M_w.total() (None if it is zero), M_w being the twist of M along
+    word. Results are yielded as soon as they are available, so the
+    order is not deterministic.
+
+    Nodes of the tree are expanded in this process until there are
+    at least split of them (by default four per worker); each of
+    these subtrees is then computed by one of max_workers worker
+    processes (by default one per core). If reduce=True, each twist
+    is replaced by its minimal model.
+
+    If braids (a braids.BraidMonoid, e.g. BraidMonoid.from_category(
+    M.cat)) is given, only words in braid normal form are reported.
+    '''
+    if objects is None:
+        objects=sorted(M.cat.objects)
+    if max_workers is None:
+        max_workers=os.cpu_count() or 1
+    if split is None:
+        split=4*max_workers
+    frontier=[((),M)]
+    while frontier and len(frontier)<split and len(frontier[0][0])<depth:
+        new_frontier=[]
+        for word,P in frontier:
+            yield report(word,P)
+            for w in children(word,objects,braids):
+                new_frontier.append((w,P.twist(w[-1],reduce)))
+        frontier=new_frontier
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # Modules are sent to the workers in compact form, which is
+        # much quicker to pickle.
+        futures=[executor.submit(subtree,P.compact(),word,depth,objects,
+                                 reduce,braids)
+                 for word,P in frontier]
+        # Drop our references so that each module only lives as long
+        # as it takes to send it to a worker.
+        del frontier
+        for future in as_completed(futures):
+            yield from future.result()
@@ -20,15 +20,37 @@ class Field():
 
         char [int]: The characteristic of K.
 
+        order [int or None]: The number of elements of K (None if K
+            is infinite).
+
+        zero, one, minus_one [numbers]: The constants 0, 1 and -1 in
+            K, created once and shared.
+
+    Fields like finite_fields.FF(p) and rationals.QQ() subclass Field
+    and produce their own compact number classes (subclasses of
+    FieldElement) which implement arithmetic directly; the functions
+    above are then only used by the generic Number class.
+
     Methods:
 
         K(n):
             Args: n [int]
             Returns [number]: Turns n into an element of K.
+
+        K.pack(numbers), K.unpack(data):
+            Convert a list of numbers over K into a compact form
+            which is cheap to store and pickle, and back again. Here
+            the compact form is just a list; FF(p) and QQ() use
+            arrays of machine integers.
+
+        K.descriptor():
+            Returns a tuple of plain data (e.g. ('FF',p) or ('QQ',))
+            from which fields.from_descriptor rebuilds K. Generic
+            fields have no descriptor and raise TypeError.
     '''
     def __init__(self,num_init,num_add,num_sub,num_mul,
                  num_div,num_inv,num_neg,num_eq,num_num,
-                 num_print,char):
+                 num_print,char,order=None):
         self.num_init=num_init
         self.num_add=num_add
         self.num_sub=num_sub
@@ -40,17 +62,47 @@ class Field():
         self.num_num=num_num
         self.num_print=num_print
         self.char=char
+        self.order=order
+        self.zero=self(0)
+        self.one=self(1)
+        self.minus_one=-self.one
 
     def __call__(self,n):
         '''This function converts integers into field elements
         using the function specified by num_num.
         '''
-        if type(n) is Number:
+        if isinstance(n,FieldElement):
             return n
         else:
             return Number(self,self.num_num(n))
+
+    def pack(self,numbers):
+        '''Returns the numbers in a compact form (see unpack).'''
+        return list(numbers)
+
+    def unpack(self,data):
+        '''Returns the list of numbers stored by pack.'''
+        return list(data)
+
+    def descriptor(self):
+        '''Returns a tuple describing K (see from_descriptor).'''
+        raise TypeError('This field has no descriptor')
         
-class Number():
+def from_descriptor(descriptor):
+    '''Returns the field described by K.descriptor().'''
+    if descriptor[0]=='FF':
+        import finite_fields
+        return finite_fields.FF(descriptor[1])
+    elif descriptor[0]=='QQ':
+        import rationals
+        return rationals.QQ()
+    raise ValueError('Unknown field descriptor: {}'.format(descriptor))
+
+class FieldElement():
+    '''The common base class of numbers over all fields.'''
+    __slots__=()
+
+class Number(FieldElement):
     '''Instantiates a number over a specified field, K.
 
     The methods for adding and multiplying numbers over K etc
@@ -73,7 +125,7 @@ class Number():
     
     def __mul__(self,other):
         K=self.field
-        if type(other) is Number:
+        if isinstance(other,FieldElement):
             return Number(K,K.num_mul(self,other))
         else:
             return NotImplemented
@@ -2,6 +2,7 @@
 
 import fields as fi
 import arithmetic as ar
+from array import array
 
 def FF(p):
     '''Creates an instance of the field Z/p.'''
@@ -49,7 +50,7 @@ def FF(p):
     def ff_eq(x,y):
         '''Tests equality of numbers over Z/p'''
         a=x.value
-        if type(y) is fi.Number:
+        if isinstance(y,fi.FieldElement):
             b=y.value
         else:
             b=y
@@ -67,5 +68,123 @@ def FF(p):
         a=x.value
         return str(a%p)
 
-    return fi.Field(ff_init,ff_add,ff_sub,ff_mul,ff_div,
-                    ff_inv,ff_neg,ff_eq,ff_num,ff_print,p)
+    return FiniteField(ff_init,ff_add,ff_sub,ff_mul,ff_div,
+                       ff_inv,ff_neg,ff_eq,ff_num,ff_print,p,p)
+
+class FiniteField(fi.Field):
+    '''The field Z/p, as created by FF(p).
+
+    Numbers over Z/p are FFNumbers rather than generic Numbers, and
+    two copies of Z/p are equal if they have the same characteristic
+    (so that, for example, unpickled copies remain compatible).
+    '''
+    def __call__(self,n):
+        '''Sends an integer n to its reduction mod p.'''
+        if isinstance(n,fi.FieldElement):
+            return n
+        else:
+            return self.element(n%self.char)
+
+    def __init__(self,*args):
+        self.constants={}
+        super().__init__(*args)
+        self.constants={0: self.zero,1: self.one}
+        self.minus_one=self.element(self.char-1)
+        self.constants[self.char-1]=self.minus_one
+
+    def element(self,a):
+        '''Returns the number a over Z/p, where 0<=a<p, reusing the
+        stored constants 0, 1 and -1 where possible.'''
+        x=self.constants.get(a)
+        if x is None:
+            return FFNumber(self,a)
+        return x
+
+    def pack(self,numbers):
+        '''Returns the values of the numbers as an array of the smallest
+        unsigned integer type which holds them.'''
+        if self.char<=1<<8:
+            typecode='B'
+        elif self.char<=1<<16:
+            typecode='H'
+        else:
+            typecode='Q'
+        return array(typecode,(x.value for x in numbers))
+
+    def unpack(self,data):
+        '''Returns the list of numbers whose values are stored in data.'''
+        return [self.element(a) for a in data]
+
+    def descriptor(self):
+        '''Returns ('FF',p) (see fields.from_descriptor).'''
+        return ('FF',self.char)
+
+    def __eq__(self,other):
+        return type(other) is FiniteField and other.char==self.char
+
+    def __hash__(self):
+        return hash(('FF',self.char))
+
+    def __reduce__(self):
+        return (FF,(self.char,))
+
+class FFNumber(fi.FieldElement):
+    '''A number over Z/p, stored as its representative 0<=value<p.'''
+    __slots__=('field','value')
+
+    def __init__(self,K,value):
+        self.field=K
+        self.value=value
+
+    def __add__(self,other):
+        K=self.field
+        return K.element((self.value+other.value)%K.char)
+
+    def __sub__(self,other):
+        K=self.field
+        return K.element((self.value-other.value)%K.char)
+
+    def __mul__(self,other):
+        if isinstance(other,fi.FieldElement):
+            K=self.field
+            return K.element((self.value*other.value)%K.char)
+        else:
+            return NotImplemented
+
+    def __truediv__(self,other):
+        return self*other.I()
+
+    def __neg__(self):
+        K=self.field
+        return K.element((-self.value)%K.char)
+
+    def I(self):
+        '''Inversion of numbers over Z/p'''
+        if self.value==0:
+            raise ZeroDivisionError("Can't invert zero!")
+        K=self.field
+        return K.element(pow(self.value,-1,K.char))
+
+    def residue(self,p):
+        '''Returns the value of the number as an integer mod p (which
+        must be the characteristic).'''
+        if p!=self.field.char:
+            raise ValueError('Cannot reduce a number over Z/%d mod %d'
+                             % (self.field.char,p))
+        return self.value
+
+    def __eq__(self,other):
+        '''Tests equality with numbers over Z/p or with integers.'''
+        if isinstance(other,fi.FieldElement):
+            return self.value==other.value%self.field.char
+        else:
+            return self.value==other%self.field.char
+
+    def __hash__(self):
+        return hash(self.value)
+
+    def __str__(self):
+        return str(self.value)
+
+    def __reduce__(self):
+        return (self.field.element,(self.value,))
@@ -0,0 +1,46 @@
+#!/usr/bin/python
+
+# These are some routines for computing ranks over the field Z/2,
+# where the columns of a linear map are packed into bitsets (Python
+# integers) and added by XOR. Vectors themselves are stored as
+# dictionaries of components over every field.
+
+def is_gf2(K):
+    '''Returns true if K is the field Z/2.'''
+    return K.order==2
+
+def bitset(components,index):
+    '''Given a dictionary of components {i: Number} of a vector over
+    Z/2 and a dictionary index {i: n} of bit positions, returns the
+    vector as an integer whose nth bit is the i-component.'''
+    bits=0
+    for i,x in components.items():
+        if x!=0:
+            bits^=1<<index[i]
+    return bits
+
+def rank(columns):
+    '''Given an iterable of integers (bitsets), returns the dimension
+    of the subspace of (Z/2)^n that they span.
+
+    This is Gaussian elimination: each column is reduced against the
+    pivots found so far (keyed by their highest bit) and becomes a new
+    pivot if it does not reduce to zero.
+    '''
+    pivots={}
+    for col in columns:
+        while col:
+            top=col.bit_length()-1
+            if top in pivots:
+                col^=pivots[top]
+            else:
+                pivots[top]=col
+                break
+    return len(pivots)
+
+def ker_im(F):
+    '''Returns a 2-tuple of integers (nullity(F),rank(F)) for a linear
+    map F over Z/2.'''
+    index={i: n for n,i in enumerate(F.target.basis)}
+    r=rank(bitset(F[i].components,index) for i in F.source.basis)
+    return len(F.source.basis)-r,r
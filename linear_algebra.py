@@ -1,7 +1,16 @@
 #!/usr/bin/python
 
 import fields as fi
+import finite_fields as ff
+import arithmetic as ar
+import gf2
 from collections import Counter, ChainMap
+from collections.abc import Mapping
+import heapq
+import itertools
+import math
+import random
+from array import array
 
 class AlgebraicStructure:
     '''The class of algebraic structures.
@@ -21,6 +30,13 @@ class AlgebraicStructure:
         for name in self._empty_dictionaries:
             setattr(self,name,{})
 
+    def __getstate__(self):
+        '''Lazily-computed properties are not pickled (they are computed
+        again when they are needed).'''
+        cls=type(self)
+        return {name: value for name,value in self.__dict__.items()
+                if not isinstance(getattr(cls,name,None),lazyproperty)}
+
     @staticmethod
     def compat(objects,*args):
         truth=True
@@ -110,6 +126,12 @@ class VectorSpace(AlgebraicStructure):
             returns the same vector space, but with its basis indexed
             by tuples (i_0,...,i_{m-1},(i_m,...,i_{n-1}),i_n,...,i_k).
 
+        V.index(i), V.key(n)
+
+            V.index(i) returns the position of the basis element i in
+            the iteration order of V.basis and V.key(n) returns the
+            basis element in position n.
+
         V.build(graded_dim)
 
             Builds a graded vector space with graded pieces of the
@@ -127,6 +149,14 @@ class VectorSpace(AlgebraicStructure):
             ('a',i) for i in V.basis
             ('b',j) for j in W.basis
     
+        VectorSpace.indexed_sum(V_1,...,V_n)
+
+            Returns a 2-tuple (U,translators) where U is the direct sum
+            V_1 (+) ... (+) V_n indexed by integers 0,1,2,... (the
+            basis of V_1 first, in order, then that of V_2, etc.) and
+            translators[i] is the dictionary {x: integer index of x in
+            U} for x in V_i.basis.
+
         V.otimes(W)
 
             Returns the tensor product of V and W, indexed by 2-tuples
@@ -135,7 +165,8 @@ class VectorSpace(AlgebraicStructure):
         VectorSpace.tensor(V_1,...,V_n)
 
             Returns the tensor product V_1 (x) ... (x) V_n, indexed by
-            n-tuples of basis elements.
+            n-tuples of basis elements. This is a TensorSpace, whose
+            basis is not stored but computed from the factors.
 
         V.Id()
 
@@ -167,11 +198,31 @@ class VectorSpace(AlgebraicStructure):
                                           if self.basis[i]==n})
         return graded_pieces
 
+    @lazyproperty
+    def positions(self):
+        '''Returns the dictionary {i: position of i in V.basis}.'''
+        return {i: n for n,i in enumerate(self.basis)}
+
+    @lazyproperty
+    def ordered_basis(self):
+        '''Returns the list of basis elements of V, in order.'''
+        return list(self.basis)
+
+    def index(self,i):
+        '''Returns the position of the basis element i in V.basis.'''
+        return self.positions[i]
+
+    def key(self,n):
+        '''Returns the basis element in position n of V.basis.'''
+        return self.ordered_basis[n]
+
     def __getitem__(self,i):
-        return Vector(self,{i:self.field(1)})
+        return Vector(self,{i:self.field.one})
     
     def __eq__(self,other):
-        if type(other) is VectorSpace:
+        if other is self:
+            return True
+        elif isinstance(other,VectorSpace):
             return (self.basis==other.basis)
         elif other==0:
             return not self.basis
@@ -234,7 +285,7 @@ class VectorSpace(AlgebraicStructure):
     def shift(self,n=1):
         '''Returns the vector space shifted down in degree by n.'''
         W=VectorSpace(self.field)
-        W.basis.update({i: self.basis[i]-n for i in self.basis})
+        W.basis.update({i: d-n for i,d in self.basis.items()})
         return W
     
     def oplus(self,other):
@@ -244,10 +295,25 @@ class VectorSpace(AlgebraicStructure):
         '''
         if AlgebraicStructure.compat((self,other),'field'):
             U=VectorSpace(self.field)
-            U.basis.update({('a',i): self.basis[i] for i in self.basis})
-            U.basis.update({('b',j): other.basis[j] for j in other.basis})
+            U.basis.update({('a',i): d for i,d in self.basis.items()})
+            U.basis.update({('b',j): d for j,d in other.basis.items()})
             return U
 
+    @staticmethod
+    def indexed_sum(*args):
+        '''Given vector spaces V_1,...,V_n, returns their direct sum U
+        indexed by integers together with the list of dictionaries
+        translating the basis elements of each V_i into integers.'''
+        if AlgebraicStructure.compat(args,'field'):
+            U=VectorSpace(args[0].field)
+            translators=[]
+            for V in args:
+                start=len(U.basis)
+                translators.append({i: start+n for n,i in enumerate(V.basis)})
+                U.basis.update(zip(range(start,start+len(V.basis)),
+                                   V.basis.values()))
+            return U,translators
+
     def otimes(self,other):
         '''Returns the tensor product of two vector spaces, indexed by
         2-tuples of basis elements.'''
@@ -262,22 +328,7 @@ class VectorSpace(AlgebraicStructure):
         '''
         if len(args)>1:
             if AlgebraicStructure.compat(args,'field'):
-                U=VectorSpace(args[0].field)
-                build_basis=[()]
-                for X in args:
-                    build_basis=[x+(y,) for x in build_basis for y in X.basis]
-                    
-                def grading(elt):
-                    '''Returns the grading |elt| of elt=(x_1,...,x_n)
-                    where x_i in X_i and |elt|=\sum_{i=1}^n |x_i|.
-                    '''
-                    ans=0
-                    for i, val in enumerate(elt):
-                        ans+=args[i].basis[val]
-                    return ans
-                
-                U.basis.update({x: grading(x) for x in build_basis})
-                return U
+                return TensorSpace(args[0].field,tuple(args))
         else:
             return args[0]
         
@@ -298,6 +349,173 @@ class VectorSpace(AlgebraicStructure):
         return F
 
 
+class TensorBasis(Mapping):
+    '''The basis of a tensor product V_1 (x) ... (x) V_n, as a read-only
+    dictionary {(x_1,...,x_n): |x_1|+...+|x_n|}. Nothing is stored
+    except the factors: membership, gradings and iteration are all
+    computed from the bases of the factors when they are asked for.
+    Iteration is in lexicographic order (the last factor varying
+    fastest).'''
+    def __init__(self,factors):
+        self.factors=factors
+
+    def __getitem__(self,x):
+        if type(x) is not tuple or len(x)!=len(self.factors):
+            raise KeyError(x)
+        ans=0
+        for V,i in zip(self.factors,x):
+            ans+=V.basis[i]
+        return ans
+
+    def __contains__(self,x):
+        return (type(x) is tuple and len(x)==len(self.factors)
+                and all(i in V.basis for V,i in zip(self.factors,x)))
+
+    def __iter__(self):
+        return itertools.product(*(V.basis for V in self.factors))
+
+    def __len__(self):
+        return math.prod(len(V.basis) for V in self.factors)
+
+    def items(self):
+        for parts in itertools.product(*(V.basis.items() for V in self.factors)):
+            yield tuple(i for i,_ in parts),sum(n for _,n in parts)
+
+    def values(self):
+        for gradings in itertools.product(*(V.basis.values() for V in self.factors)):
+            yield sum(gradings)
+
+    def __eq__(self,other):
+        if other is self:
+            return True
+        if not isinstance(other,Mapping):
+            return NotImplemented
+        if len(other)!=len(self):
+            return False
+        if (isinstance(other,TensorBasis)
+            and len(other.factors)==len(self.factors)
+            and all(V==W for V,W in zip(self.factors,other.factors))):
+            return True
+        # Two dictionaries of the same size are equal if every entry of
+        # one is an entry of the other. We look the entries of other up
+        # in self, so that self is never stored in full (nor is other,
+        # if it is also a TensorBasis).
+        for x,n in other.items():
+            if x not in self or self[x]!=n:
+                return False
+        return True
+
+    __hash__=None
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+class TensorSpace(VectorSpace):
+    '''Class of tensor products of vector spaces.
+
+    USAGE:
+
+        V=TensorSpace(K,(V_1,...,V_n))
+
+    or, more usually, V=VectorSpace.tensor(V_1,...,V_n), creates the
+    tensor product V_1 (x) ... (x) V_n (for n>1). This behaves like any
+    other VectorSpace (its basis is indexed by n-tuples of basis
+    elements) but only the factors are stored, so its memory does not
+    grow with its dimension.
+
+    ATTRIBUTES:
+
+        V.factors [tuple of VectorSpaces]
+
+        V.basis [TensorBasis]
+
+            A read-only dictionary {(x_1,...,x_n): grading}.
+
+    METHODS:
+
+        V.index(x)
+
+            Returns the position of the basis element x in the
+            iteration order of V.basis; this is the mixed-radix number
+            whose digits are the positions of x_i in V_i.basis.
+
+        V.key(n)
+
+            Returns the basis element in position n (the inverse of
+            V.index).
+
+    V.flatten(k) and V.unflatten(m,n) return TensorSpaces (with
+    factors spliced in or grouped together) whenever this makes sense.
+    '''
+    _required_fields=['field','factors']
+    _empty_dictionaries=[]
+
+    def __init__(self,*args):
+        super().__init__(*args)
+        self.basis=TensorBasis(self.factors)
+
+    @lazyproperty
+    def gr_dim(self):
+        '''Returns the graded dimension, computed by convolving the graded
+        dimensions of the factors.'''
+        dims=Counter({0: 1})
+        for V in self.factors:
+            new_dims=Counter()
+            for a,m in dims.items():
+                for b,n in V.gr_dim.items():
+                    new_dims[a+b]+=m*n
+            dims=new_dims
+        return Counter({d: n for d,n in dims.items() if n})
+
+    @lazyproperty
+    def factor_positions(self):
+        '''Returns a list of dictionaries {x_i: position of x_i in V_i.basis}.'''
+        return [{i: n for n,i in enumerate(V.basis)} for V in self.factors]
+
+    @lazyproperty
+    def factor_keys(self):
+        '''Returns a list of the lists of basis elements of the factors.'''
+        return [list(V.basis) for V in self.factors]
+
+    def index(self,x):
+        '''Returns the position of the basis element x in V.basis.'''
+        n=0
+        for keys,positions,i in zip(self.factor_keys,self.factor_positions,x):
+            n=n*len(keys)+positions[i]
+        return n
+
+    def key(self,n):
+        '''Returns the basis element in position n of V.basis.'''
+        x=[]
+        for keys in reversed(self.factor_keys):
+            n,r=divmod(n,len(keys))
+            x.append(keys[r])
+        return tuple(reversed(x))
+
+    def shift(self,n=1):
+        '''Returns the tensor product shifted down in degree by n (by
+        shifting its first factor).'''
+        return TensorSpace(self.field,(self.factors[0].shift(n),)+self.factors[1:])
+
+    def flatten(self,k):
+        '''As VectorSpace.flatten, but if the kth factor is itself a
+        TensorSpace then the result is the TensorSpace with its
+        factors spliced in.'''
+        V=self.factors[k]
+        if isinstance(V,TensorSpace):
+            return TensorSpace(self.field,
+                               self.factors[:k]+V.factors+self.factors[k+1:])
+        return super().flatten(k)
+
+    def unflatten(self,m,n):
+        '''As VectorSpace.unflatten, but returns a TensorSpace whose mth
+        factor is the tensor product of factors m,...,n-1 when there are
+        at least two of those and at least one other factor.'''
+        if n-m>1 and n-m<len(self.factors):
+            inner=TensorSpace(self.field,self.factors[m:n])
+            return TensorSpace(self.field,
+                               self.factors[:m]+(inner,)+self.factors[n:])
+        return super().unflatten(m,n)
     
 class Vector(AlgebraicStructure):
     '''Class of vectors.
@@ -394,7 +612,7 @@ class Vector(AlgebraicStructure):
         if i in self.components:
             return self.components[i]
         else:
-            return self.space.field(0)
+            return self.space.field.zero
 
     def __str__(self):
         '''Prints the vector as a linear combination of basis vectors.'''
@@ -406,15 +624,32 @@ class Vector(AlgebraicStructure):
     def __add__(self,other):
         '''Adds two vectors.'''
         if AlgebraicStructure.compat((self,other),'space'):
-            sum_cpts=ChainMap(self.components,other.components)
-            return Vector(self.space,{i: self[i]+other[i] for i in sum_cpts}).chomp()
+            sum_cpts={i: x for i,x in self.components.items() if x!=0}
+            for i,y in other.components.items():
+                if i in sum_cpts:
+                    z=sum_cpts[i]+y
+                    if z==0:
+                        del sum_cpts[i]
+                    else:
+                        sum_cpts[i]=z
+                elif y!=0:
+                    sum_cpts[i]=y
+            return Vector(self.space,sum_cpts)
             
     def __sub__(self,other):
         '''Subtracts two vectors'''
         if AlgebraicStructure.compat((self,other),'space'):
-            sum_cpts=ChainMap(self.components,other.components)
-            return Vector(self.space,{i: self[i]-other[i]
-                                      for i in sum_cpts}).chomp()
+            sum_cpts={i: x for i,x in self.components.items() if x!=0}
+            for i,y in other.components.items():
+                if i in sum_cpts:
+                    z=sum_cpts[i]-y
+                    if z==0:
+                        del sum_cpts[i]
+                    else:
+                        sum_cpts[i]=z
+                elif y!=0:
+                    sum_cpts[i]=-y
+            return Vector(self.space,sum_cpts)
 
     def __mul__(self,t):
         '''Rescales v by an element t of the field.'''
@@ -493,7 +728,7 @@ class Vector(AlgebraicStructure):
                 new_cpts=[x+(y,) for x in new_cpts for y in v.components]
                 
             def cpt(x):
-                ans=K(1)
+                ans=K.one
                 for i, val in enumerate(x):
                     ans*=args[i].components[val]
                 return ans
@@ -624,6 +859,8 @@ class LinearMap(AlgebraicStructure):
 
                 F_1 (x) F_2 (x) ... (x) F_n.
 
+            This is a KroneckerMap, which only stores the factors.
+
         LinearMap.block(A,B,C,D)
 
             Given linear maps:
@@ -636,9 +873,31 @@ class LinearMap(AlgebraicStructure):
                 (A B): V(+)V' --> W(+)W'
                 (C D)
 
+        LinearMap.indexed_block(A,B,C,D,V,W,sources,targets,head=False)
+
+            As LinearMap.block(A,B,C,D), but returns a map V-->W
+            where V and W are direct sums indexed by integers (see
+            VectorSpace.indexed_sum) and sources, targets are the
+            2-tuples of dictionaries which translate basis elements
+            of the summands into integers. If head=True then the basis
+            elements of V are tuples and only their first entries
+            are translated.
+
+        F.sparse()
+
+            Returns the matrix of F as a SparseMatrix.
+
+        F.columnar()
+
+            Returns F stored as a ColumnarMap.
+
         F.ker_im()
 
-            Returns a 2-tuple of integers (nullity(F),rank(F)).
+            Returns a 2-tuple of integers (nullity(F),rank(F)). Over
+            Z/2 this uses bitset elimination (see gf2.py), otherwise
+            sparse elimination (see SparseMatrix). Over the rationals,
+            F.ker_im(method='multimodular') computes the rank modulo
+            several primes instead.
     '''
     _required_fields=['source','target','deg']
     _empty_dictionaries=['maps']
@@ -659,16 +918,21 @@ class LinearMap(AlgebraicStructure):
     def __call__(self,other):
         '''Evaluates a function on a vector.'''
         if other.space==self.source:
-            w=Vector(self.target,{})
-            for i in other.components:
-                w+=other[i]*self[i]
-            return w.chomp()
+            cpts={}
+            for i,t in other.components.items():
+                if i in self.maps:
+                    for j,x in self.maps[i].components.items():
+                        if j in cpts:
+                            cpts[j]=cpts[j]+t*x
+                        else:
+                            cpts[j]=t*x
+            return Vector(self.target,cpts).chomp()
         else:
             raise TypeError('Cannot apply this map to this vector')    
 
     def __eq__(self,other):
         '''Tests if the difference of two linear maps is zero.'''
-        if type(other) is LinearMap:
+        if isinstance(other,LinearMap):
             return not (self-other).maps
         elif other==0:
             return not self.maps
@@ -766,7 +1030,7 @@ class LinearMap(AlgebraicStructure):
         '''Returns the restriction of a linear map to a subspace of its domain.'''
         subbasis_set={i for i in V.basis}
         basis_set={i for i in self.source.basis}
-        if subbasis_set<basis_set:
+        if subbasis_set<=basis_set:
             new_map=LinearMap(V,self.target,self.deg)
             new_map.maps.update({i: self[i] for i in subbasis_set})
             return new_map
@@ -801,7 +1065,7 @@ class LinearMap(AlgebraicStructure):
         if not m%2:
             (M,N,d)=(self.source,self.target,self.deg)
             new_map=LinearMap(M.shift(m),N.shift(m),d)
-            new_map.maps.update({i: (self.maps[i].shift(m))*K(-1)
+            new_map.maps.update({i: (self.maps[i].shift(m))*K.minus_one
                                  for i in self.maps})
             return new_map
         else:
@@ -835,20 +1099,7 @@ class LinearMap(AlgebraicStructure):
         tensor(*args) returns the map f_1*f_2*...*f_n.
         '''
         if len(args)>1:
-            new_source=VectorSpace.tensor(*tuple(f.source for f in args))
-            new_target=VectorSpace.tensor(*tuple(f.target for f in args))
-            new_deg=sum(f.deg for f in args)
-            F=LinearMap(new_source,new_target,new_deg)
-            new_maps=[()]
-            for f in args:
-                new_maps=[x+(y,) for x in new_maps for y in f.maps]
-                
-            def result(x):
-                vec_tup=tuple(args[i].maps[val] for i, val in enumerate(x))
-                return Vector.tensor(*vec_tup)
-            
-            F.maps.update({x: result(x) for x in new_maps})
-            return F.chomp()
+            return KroneckerMap(tuple(args))
         else:
             return args[0]
     
@@ -869,40 +1120,1010 @@ class LinearMap(AlgebraicStructure):
         E=LinearMap(V1.oplus(V2),W1.oplus(W2),A.deg)
         first_keys=ChainMap(A.maps,C.maps)
         second_keys=ChainMap(B.maps,D.maps)
-        E.maps.update({('a',i):(A[i]).oplus(C[i]) for i in first_keys})
-        E.maps.update({('b',j):(B[j]).oplus(D[j]) for j in second_keys})
+        # Build the columns directly in E.target rather than with
+        # Vector.oplus, which would construct a new target space for
+        # every column.
+        def column(v,w):
+            cpts={('a',i): x for i,x in v.components.items()}
+            cpts.update({('b',j): y for j,y in w.components.items()})
+            return Vector(E.target,cpts)
+        E.maps.update({('a',i): column(A[i],C[i]) for i in first_keys})
+        E.maps.update({('b',j): column(B[j],D[j]) for j in second_keys})
+        return E
+
+    @staticmethod
+    def indexed_block(A,B,C,D,V,W,sources,targets,head=False):
+        '''Returns the block map
+
+        (A B): V --> W
+        (C D)
+
+        where V and W are direct sums indexed by integers; sources and
+        targets are the pairs of dictionaries (see VectorSpace.indexed_sum)
+        translating the basis elements of the summands of V and W into
+        integers. If head=True then the basis elements of V are tuples
+        (x,a_1,...,a_n) with x in a summand and only x is translated.
+
+        This builds each value once, in place of LinearMap.block followed
+        by flattening, unflattening and re-indexing.'''
+        E=LinearMap(V,W,A.deg)
+        first,second=targets
+        def column(v,w):
+            cpts={first[i]: x for i,x in v.components.items()}
+            cpts.update({second[j]: y for j,y in w.components.items()})
+            return Vector(W,cpts)
+        for translator,P,Q in ((sources[0],A,C),(sources[1],B,D)):
+            if head:
+                E.maps.update({(translator[i[0]],)+i[1:]: column(P[i],Q[i])
+                               for i in ChainMap(P.maps,Q.maps)})
+            else:
+                E.maps.update({translator[i]: column(P[i],Q[i])
+                               for i in ChainMap(P.maps,Q.maps)})
         return E
 
-    def ker_im(self):
+    def sparse(self):
+        '''Returns the linear map as a SparseMatrix.'''
+        return SparseMatrix.from_map(self)
+
+    def columnar(self):
+        '''Returns the linear map as a ColumnarMap.'''
+        return ColumnarMap.from_map(self)
+
+    def ker_im(self,method=None,primes=None):
         '''Implements Gaussian elimination to find the nullity and rank
-        of a linear map.'''
-        F,V=self,self.source
-        F.chomp()
-        candidates=[V[i] for i in V.basis]
-        kernel=[]
-        image=[]
-        
-        def ker_pop():
-            casualties=[]
-            survivors=[]
-            for v in candidates:
-                if F(v)==0:
-                    casualties.append(v)
-                else:
-                    survivors.append(v)
-            kernel.extend(casualties)
-            return survivors
-        
-        candidates=ker_pop()
-        while candidates:
-            x=candidates[0]
-            image.append(x)
-            if len(candidates)!=1:
-                m=list(F(x).components.keys())[0]
-                new_candidates=candidates[1:]
-                candidates=[(y-(F(y)[m]/F(x)[m])*x).chomp()
-                            for y in new_candidates]
-                candidates=ker_pop()
+        of a linear map. Over Z/2 the columns are packed into bitsets
+        and eliminated using XOR (see gf2.py); otherwise the map is
+        converted to a SparseMatrix and eliminated there.
+
+        Over the rationals, method='multimodular' computes the rank
+        modulo several word-sized primes instead (see
+        SparseMatrix.multimodular_rank). Over Z/p, method='blackbox'
+        computes it by Wiedemann's method, without any elimination (see
+        SparseMatrix.blackbox_rank), and method='auto' does so only for
+        large maps over Z/p with p large.'''
+        if method=='auto':
+            big=_use_blackbox(self.field,len(self.target.basis),
+                              len(self.source.basis))
+            method='blackbox' if big else None
+        if method in ('multimodular','blackbox'):
+            return self.sparse().ker_im(method,primes)
+        elif method is not None:
+            raise ValueError('Unknown method for ker_im: {}'.format(method))
+        if gf2.is_gf2(self.field):
+            return gf2.ker_im(self)
+        return self.sparse().ker_im()
+
+
+class KroneckerEntries(Mapping):
+    '''The dictionary of values F.maps of a KroneckerMap F, computed
+    from the factors when they are asked for. Only basis elements
+    whose image is nonzero in every factor appear.'''
+    def __init__(self,F):
+        self.F=F
+
+    def __getitem__(self,x):
+        F=self.F
+        images=[f.maps[i] for f,i in zip(F.factors,F.split(x))]
+        if not all(v.components for v in images):
+            raise KeyError(x)
+        return F.image(images)
+
+    def __contains__(self,x):
+        try:
+            keys=self.F.split(x)
+        except KeyError:
+            return False
+        return all(i in f.maps and f.maps[i].components
+                   for f,i in zip(self.F.factors,keys))
+
+    def __iter__(self):
+        for x,v in self.items():
+            yield x
+
+    def items(self):
+        F=self.F
+        nonzero=[[(i,v) for i,v in f.maps.items() if v.components]
+                 for f in F.factors]
+        for parts in itertools.product(*nonzero):
+            yield (F.join(tuple(i for i,_ in parts)),
+                   F.image([v for _,v in parts]))
+
+    def values(self):
+        for x,v in self.items():
+            yield v
+
+    def __len__(self):
+        return math.prod(sum(1 for v in f.maps.values() if v.components)
+                         for f in self.F.factors)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+class KroneckerMap(LinearMap):
+    '''Class of tensor products of linear maps.
+
+    USAGE:
+
+        F=KroneckerMap((F_1,...,F_n))
+
+    or, more usually, F=LinearMap.tensor(F_1,...,F_n), creates the
+    tensor product F_1 (x) ... (x) F_n (for n>1), with
+
+        F(x_1 (x) ... (x) x_n) = F_1(x_1) (x) ... (x) F_n(x_n)
+
+    (as for LinearMap.tensor, there are no Koszul signs). This
+    behaves like any other LinearMap, but only the factors are
+    stored: F.maps is a read-only dictionary (a KroneckerEntries)
+    whose values are computed when they are needed.
+
+    ATTRIBUTES:
+
+        F.factors [tuple of LinearMaps]
+
+        F.shape, F.templates, F.leaf_spaces
+
+            The source of F starts out as the tensor product of the
+            sources of the factors, but F.flatten and F.unflatten
+            change the way its basis elements are nested. We keep
+            track of this by numbering the "leaves" (the entries
+            which are never split further) with integers: F.shape is
+            a nested tuple of leaves with the same nesting as the
+            basis elements of F.source, F.templates[i] is a leaf or a
+            nested tuple of leaves with the same nesting as the basis
+            elements of F.factors[i].source, and F.leaf_spaces[l] is
+            the vector space in which leaf l lives.
+
+    METHODS:
+
+        F.split(x)
+
+            Returns the tuple of basis elements (x_1,...,x_n) of the
+            sources of the factors corresponding to the basis element
+            x of F.source; raises KeyError if x has the wrong shape.
+
+        F.join((x_1,...,x_n))
+
+            The inverse of F.split.
+
+        F.expand()
+
+            Returns F as an ordinary LinearMap, with all of its
+            values computed and stored.
+
+    F(v), F.circ(G), F.flatten(k) and F.unflatten(m,n) all work
+    without expanding F. If G is also a KroneckerMap with matching
+    factors then F.circ(G) is computed factor by factor.
+    '''
+    _required_fields=['factors']
+    _empty_dictionaries=[]
+
+    def __init__(self,*args):
+        super().__init__(*args)
+        n=len(self.factors)
+        self.source=VectorSpace.tensor(*(f.source for f in self.factors))
+        self.target=VectorSpace.tensor(*(f.target for f in self.factors))
+        self.deg=sum(f.deg for f in self.factors)
+        self.shape=tuple(range(n))
+        self.templates=tuple(range(n))
+        self.leaf_spaces=[f.source for f in self.factors]
+        self.maps=KroneckerEntries(self)
+
+    def reshaped(self,source,shape,templates,leaf_spaces):
+        '''Returns a copy of F with a different nesting of its source.'''
+        F=KroneckerMap(self.factors)
+        F.source=source
+        F.shape=shape
+        F.templates=templates
+        F.leaf_spaces=leaf_spaces
+        return F
+
+    @lazyproperty
+    def plain(self):
+        '''Returns true if the basis elements of F.source are just the
+        tuples (x_1,...,x_n).'''
+        n=len(self.factors)
+        return self.shape==tuple(range(n)) and self.templates==tuple(range(n))
+
+    def split(self,x):
+        '''Returns the tuple of basis elements of the sources of the
+        factors which corresponds to x.'''
+        if self.plain:
+            if type(x) is not tuple or len(x)!=len(self.factors):
+                raise KeyError(x)
+            return x
+        leaves=[None]*len(self.leaf_spaces)
+        def read(shape,y):
+            if type(shape) is int:
+                leaves[shape]=y
+            elif type(y) is tuple and len(y)==len(shape):
+                for s,z in zip(shape,y):
+                    read(s,z)
+            else:
+                raise KeyError(x)
+        read(self.shape,x)
+        def build(template):
+            if type(template) is int:
+                return leaves[template]
+            return tuple(build(t) for t in template)
+        return tuple(build(t) for t in self.templates)
+
+    def join(self,keys):
+        '''Returns the basis element of F.source which corresponds to the
+        tuple of basis elements keys.'''
+        if self.plain:
+            return keys
+        leaves=[None]*len(self.leaf_spaces)
+        def read(template,y):
+            if type(template) is int:
+                leaves[template]=y
             else:
-                candidates=[]
-        return len(kernel),len(image)
+                for t,z in zip(template,y):
+                    read(t,z)
+        for t,y in zip(self.templates,keys):
+            read(t,y)
+        def build(shape):
+            if type(shape) is int:
+                return leaves[shape]
+            return tuple(build(s) for s in shape)
+        return build(self.shape)
+
+    def image(self,vectors):
+        '''Returns the tensor product of the given vectors (the images
+        of a basis element under the factors) as a vector in F.target.'''
+        cpts={(): self.field.one}
+        for v in vectors:
+            cpts={x+(i,): t*y for x,t in cpts.items()
+                  for i,y in v.components.items()}
+        return Vector(self.target,cpts)
+
+    def __call__(self,other):
+        '''Evaluates F on a vector.'''
+        if other.space==self.source:
+            cpts={}
+            for i,t in other.components.items():
+                if i in self.maps:
+                    for j,x in self.maps[i].components.items():
+                        if j in cpts:
+                            cpts[j]=cpts[j]+t*x
+                        else:
+                            cpts[j]=t*x
+            return Vector(self.target,cpts).chomp()
+        else:
+            raise TypeError('Cannot apply this map to this vector')
+
+    def chomp(self):
+        '''Nothing to do: zero values are never stored.'''
+        return self
+
+    def expand(self):
+        '''Returns F as a LinearMap with all of its values stored.'''
+        F=LinearMap(self.source,self.target,self.deg)
+        F.maps.update(self.maps.items())
+        return F
+
+    def circ(self,other):
+        '''Returns the composition of F with G, factor by factor if G is a
+        KroneckerMap with the same number of factors.'''
+        if (isinstance(other,KroneckerMap) and self.plain and other.plain
+            and len(self.factors)==len(other.factors)
+            and other.target==self.source):
+            return KroneckerMap(tuple(f.circ(g) for f,g in
+                                      zip(self.factors,other.factors)))
+        return LinearMap.circ(self,other)
+
+    def flatten(self,k):
+        '''As LinearMap.flatten, but without computing any values (unless
+        the kth entry of the basis elements of F.source is not known to
+        be a tensor product, in which case F is expanded first).'''
+        entry=self.shape[k]
+        templates,leaf_spaces=self.templates,self.leaf_spaces
+        if type(entry) is int:
+            V=leaf_spaces[entry]
+            if not isinstance(V,TensorSpace):
+                return self.expand().flatten(k)
+            new_leaves=tuple(range(len(leaf_spaces),
+                                   len(leaf_spaces)+len(V.factors)))
+            leaf_spaces=leaf_spaces+list(V.factors)
+            def substitute(template):
+                if type(template) is int:
+                    return new_leaves if template==entry else template
+                return tuple(substitute(t) for t in template)
+            templates=tuple(substitute(t) for t in templates)
+            entry=new_leaves
+        shape=self.shape[:k]+entry+self.shape[k+1:]
+        return self.reshaped(self.source.flatten(k),shape,templates,leaf_spaces)
+
+    def unflatten(self,m,n):
+        '''As LinearMap.unflatten, but without computing any values.'''
+        shape=self.shape[:m]+(self.shape[m:n],)+self.shape[n:]
+        return self.reshaped(self.source.unflatten(m,n),shape,
+                             self.templates,self.leaf_spaces)
+
+def _index_typecode(n):
+    '''Returns the smallest array typecode for the integers 0,...,n-1.'''
+    if n<=1<<8:
+        return 'B'
+    elif n<=1<<16:
+        return 'H'
+    elif n<=1<<32:
+        return 'L'
+    return 'Q'
+
+def _detach(data):
+    '''Returns data with every memoryview in it (for example, one which
+    points into a memory-mapped file) replaced by an array.'''
+    if isinstance(data,memoryview):
+        return array(data.format,data)
+    elif isinstance(data,tuple):
+        return tuple(_detach(x) for x in data)
+    return data
+
+class ColumnarMap(AlgebraicStructure):
+    '''Class of linear maps stored as three flat arrays.
+
+    USAGE:
+
+        F=ColumnarMap(source,target,deg,cols,rows,data)
+
+    or, more usefully,
+
+        F=ColumnarMap.from_map(G)
+
+    which stores the nonzero entries of the linear map G. Each entry
+    is a 3-tuple (column, row, coefficient) where the column is the
+    position (see VectorSpace.index) of a basis element of the source
+    and the row is the position of a basis element of the target.
+
+    ATTRIBUTES:
+
+        F.source,F.target [VectorSpaces]
+
+        F.deg [int]
+
+        F.cols, F.rows [arrays of ints]
+
+            The column and row of each entry, with the entries of
+            each column stored together. These (and the arrays in
+            F.data) may also be memoryviews, e.g. of a file opened by
+            storage.load; they are copied into arrays if F is pickled.
+
+        F.data
+
+            The coefficients of the entries, packed with
+            F.field.pack (for FF(p) and QQ() these are arrays of
+            integers).
+
+    METHODS:
+
+        F.nnz()
+
+            Returns the number of stored entries.
+
+        F.to_map()
+
+            Returns F as a LinearMap.
+    '''
+    _required_fields=['source','target','deg','cols','rows','data']
+
+    @lazyproperty
+    def field(self):
+        '''Returns the field over which the linear map is linear.'''
+        return self.source.field
+
+    @staticmethod
+    def from_map(F):
+        '''Returns the linear map F stored as a ColumnarMap.'''
+        cols=array(_index_typecode(len(F.source.basis)))
+        rows=array(_index_typecode(len(F.target.basis)))
+        values=[]
+        for i,v in F.maps.items():
+            j=F.source.index(i)
+            for k,x in v.components.items():
+                if x!=0:
+                    cols.append(j)
+                    rows.append(F.target.index(k))
+                    values.append(x)
+        return ColumnarMap(F.source,F.target,F.deg,cols,rows,
+                           F.field.pack(values))
+
+    def __getstate__(self):
+        '''Copies any memoryviews into arrays before pickling.'''
+        state=super().__getstate__()
+        for name in ('cols','rows','data'):
+            state[name]=_detach(state[name])
+        return state
+
+    def nnz(self):
+        '''Returns the number of stored entries.'''
+        return len(self.cols)
+
+    def to_map(self):
+        '''Returns the LinearMap with these entries.'''
+        V,W=self.source,self.target
+        F=LinearMap(V,W,self.deg)
+        cpts=None
+        last=None
+        for j,k,x in zip(self.cols,self.rows,self.field.unpack(self.data)):
+            if j!=last:
+                cpts={}
+                F.maps[V.key(j)]=Vector(W,cpts)
+                last=j
+            cpts[W.key(k)]=x
+        return F
+
+# The default probability that SparseMatrix.blackbox_rank returns a
+# wrong answer, and the smallest number of rows and columns for which
+# ker_im(method='auto') uses it.
+BLACKBOX_FAILURE=2**-40
+BLACKBOX_MIN_DIM=2000
+
+def _berlekamp_massey(sequence,p):
+    '''Returns the 2-tuple (C,L), where C=[1,c_1,...,c_L] are the
+    coefficients of the shortest linear recurrence
+
+        s_i + c_1 s_{i-1} + ... + c_L s_{i-L} = 0 (mod p)
+
+    satisfied by the sequence of integers s_0,s_1,....'''
+    C,B=[1],[1]
+    L,m,b=0,1,1
+    for n,s in enumerate(sequence):
+        d=(s+sum(C[i]*sequence[n-i] for i in range(1,L+1)))%p
+        if d==0:
+            m+=1
+            continue
+        coef=d*pow(b,p-2,p)%p
+        new_C=C+[0]*max(0,len(B)+m-len(C))
+        for i,x in enumerate(B):
+            new_C[i+m]=(new_C[i+m]-coef*x)%p
+        if 2*L<=n:
+            L,B,b,m=n+1-L,C,d,1
+        else:
+            m+=1
+        C=new_C+[0]*max(0,L+1-len(new_C))
+    return C,L
+
+def _blackbox_trial_failure(N,p):
+    '''Returns an upper bound for the probability that one trial of
+    SparseMatrix.blackbox_rank fails, for a matrix over Z/p with at
+    most N rows or columns.'''
+    return (N+1)*(9*N+4)/(2*(p-1))
+
+def _use_blackbox(K,rows,cols):
+    '''Returns True if ker_im(method='auto') should use the black-box
+    rank for a matrix over K of this size.'''
+    N=min(rows,cols)
+    return (K.char>0 and K.order==K.char and N>=BLACKBOX_MIN_DIM
+            and _blackbox_trial_failure(N,K.char)<0.5)
+
+class SparseMatrix(AlgebraicStructure):
+    '''Class of sparse matrices, stored in compressed sparse column form.
+
+    USAGE:
+
+        S=SparseMatrix(K,row_keys,col_keys,indptr,indices,data)
+
+    or, more usefully,
+
+        S=F.sparse()
+
+    which converts the linear map F into a sparse matrix whose columns
+    correspond to the basis of F.source and whose rows correspond to
+    the basis of F.target.
+
+    ATTRIBUTES:
+
+        S.field [fi.Field]
+
+        S.row_keys, S.col_keys [lists]
+
+            The basis elements of the target/source corresponding to
+            each row/column index.
+
+        S.row_index, S.col_index [dicts] {basis element: int}
+
+            The inverses of S.row_keys and S.col_keys.
+
+        S.indptr [list of ints]
+
+            The entries of column j are stored in positions
+            indptr[j],...,indptr[j+1]-1 of S.indices and S.data.
+
+        S.indices [list of ints]
+
+            The row index of each stored entry.
+
+        S.data [list of Numbers]
+
+            The (nonzero) coefficient of each stored entry.
+
+    METHODS:
+
+        S.nnz()
+
+            Returns the number of stored entries.
+
+        S.column(j)
+
+            Returns the jth column as a dictionary {row index: Number}.
+
+        S.to_map(V,W,d)
+
+            Returns the corresponding linear map V-->W of degree d.
+
+        S.residues(p)
+
+            Returns the reduction of S modulo the prime p.
+
+        S.multimodular_rank(primes=None)
+
+            Returns the rank of a matrix over the rationals, computed
+            modulo several primes.
+
+        S.integer_columns()
+
+            Returns the columns of a matrix over the rationals, each
+            scaled to a primitive vector of integers.
+
+        S.fraction_free_rank()
+
+            Returns the rank of a matrix over the rationals, by
+            elimination on integer columns (no fractions are formed).
+
+        S.blackbox_rank(failure=BLACKBOX_FAILURE,rng=None)
+
+            Returns the rank of a matrix over Z/p (p a large prime),
+            using only products of S with vectors, so that no fill-in
+            occurs. The answer is wrong with probability at most
+            failure.
+
+        S.ker_im(method=None,primes=None)
+
+            Returns a 2-tuple of integers (nullity(S),rank(S)), using
+            S.multimodular_rank(primes) if method='multimodular' and
+            S.blackbox_rank() if method='blackbox'. If method='auto',
+            the black-box rank is used for large matrices over Z/p
+            when p is large enough (see BLACKBOX_MIN_DIM). Otherwise
+            this is elimination, fraction-free over the rationals.
+    '''
+    _required_fields=['field','row_keys','col_keys','indptr','indices','data']
+
+    @staticmethod
+    def from_map(F):
+        '''Returns the sparse matrix of the linear map F.'''
+        row_keys=list(F.target.basis)
+        col_keys=list(F.source.basis)
+        row_index={i: n for n,i in enumerate(row_keys)}
+        indptr,indices,data=[0],[],[]
+        for j in col_keys:
+            if j in F.maps:
+                for i,x in F.maps[j].components.items():
+                    if x!=0:
+                        indices.append(row_index[i])
+                        data.append(x)
+            indptr.append(len(indices))
+        S=SparseMatrix(F.field,row_keys,col_keys,indptr,indices,data)
+        S.row_index=row_index
+        return S
+
+    @lazyproperty
+    def row_index(self):
+        '''Returns the dictionary {basis element: row index}.'''
+        return {i: n for n,i in enumerate(self.row_keys)}
+
+    @lazyproperty
+    def col_index(self):
+        '''Returns the dictionary {basis element: column index}.'''
+        return {j: n for n,j in enumerate(self.col_keys)}
+
+    def nnz(self):
+        '''Returns the number of stored entries.'''
+        return len(self.data)
+
+    def column(self,j):
+        '''Returns the jth column as a dictionary {row index: Number}.'''
+        start,end=self.indptr[j],self.indptr[j+1]
+        return dict(zip(self.indices[start:end],self.data[start:end]))
+
+    def to_map(self,V,W,d):
+        '''Returns the linear map V-->W of degree d with this matrix.'''
+        F=LinearMap(V,W,d)
+        for j,key in enumerate(self.col_keys):
+            cpts={self.row_keys[i]: x for i,x in self.column(j).items()}
+            if cpts:
+                F.maps[key]=Vector(W,cpts)
+        return F
+
+    def residues(self,p):
+        '''Returns the reduction of S modulo the prime p, as a sparse
+        matrix over Z/p, or None if p divides one of the denominators
+        of the entries of S.'''
+        Kp=ff.FF(p)
+        indptr,indices,data=[0],[],[]
+        for j in range(len(self.col_keys)):
+            for i,x in self.column(j).items():
+                a=x.residue(p)
+                if a is None:
+                    return None
+                if a:
+                    indices.append(i)
+                    data.append(Kp.element(a))
+            indptr.append(len(indices))
+        S=SparseMatrix(Kp,self.row_keys,self.col_keys,indptr,indices,data)
+        S.row_index=self.row_index
+        return S
+
+    def hadamard_bits(self):
+        '''Returns an upper bound for log_2 of the absolute value of any
+        minor of S, after each column has been multiplied by the lowest
+        common multiple of its denominators (which does not change the
+        rank). This is Hadamard's bound: a minor is at most the product
+        of the lengths of its columns.'''
+        bits=0
+        for j in range(len(self.col_keys)):
+            col=self.column(j).values()
+            if col:
+                lcm=1
+                for x in col:
+                    lcm=lcm*x.denominator//ar.gcd(lcm,x.denominator)
+                norm2=sum((x.numerator*(lcm//x.denominator))**2 for x in col)
+                bits+=(norm2.bit_length()+1)//2
+        return bits
+
+    def multimodular_rank(self,primes=None):
+        '''Returns the rank of a matrix over the rationals, computed as
+        the largest of its ranks modulo word-sized primes.
+
+        Reducing mod p can only lower the rank, and it lowers it only
+        if p divides every nonzero maximal minor. If primes is None, we
+        use enough primes that their product exceeds the Hadamard bound
+        for the minors (see hadamard_bits), so the answer is certain.
+        Otherwise we use the given number of primes; the answer is
+        then correct unless all of them divide the same minors, which
+        is extremely unlikely. In either case we stop early if we find
+        a prime modulo which S has full rank.
+        '''
+        if self.field.char!=0:
+            raise ValueError('Multimodular rank needs a field of characteristic 0')
+        if primes is None:
+            bits=self.hadamard_bits()
+            primes=bits//29+1
+        full=min(len(self.row_keys),len(self.col_keys))
+        rank=0
+        used=0
+        for p in ar.word_primes():
+            if used==primes or rank==full:
+                break
+            S=self.residues(p)
+            if S is None:
+                continue
+            used+=1
+            rank=max(rank,S.ker_im()[1])
+        return rank
+
+    def integer_columns(self):
+        '''Returns the dictionary {j: {i: int}} of the nonzero columns of
+        a matrix over the rationals, each multiplied by the lowest
+        common multiple of its denominators and then divided by the
+        greatest common divisor of its entries. This does not change
+        the rank.'''
+        cols={}
+        for j in range(len(self.col_keys)):
+            col=self.column(j)
+            if not col:
+                continue
+            lcm=1
+            for x in col.values():
+                lcm=lcm*x.denominator//math.gcd(lcm,x.denominator)
+            col={i: x.numerator*(lcm//x.denominator) for i,x in col.items()}
+            g=math.gcd(*col.values())
+            if g!=1:
+                col={i: a//g for i,a in col.items()}
+            cols[j]=col
+        return cols
+
+    def fraction_free_rank(self):
+        '''Returns the rank of a matrix over the rationals.
+
+        This is the elimination of ker_im, but on the integer columns
+        of S (see integer_columns), so that no fractions (and no gcds of
+        numerators and denominators) are ever formed. A column c which
+        meets the pivot row r is replaced by
+
+            (p/g) c - (c_r/g) (pivot column),   g=gcd(p,c_r),
+
+        where p is the pivot, and then divided by the gcd of its
+        entries (the sparse analogue of Bareiss' exact division), so
+        its entries stay small. Pivots are chosen as in ker_im, with
+        ties broken in favour of entries of small absolute value (a
+        pivot of 1 or -1 never scales the other columns).
+        '''
+        if self.field.char!=0:
+            raise ValueError('Fraction-free rank needs a field of characteristic 0')
+        cols=self.integer_columns()
+        row_cols={}
+        for j,col in cols.items():
+            for i in col:
+                row_cols.setdefault(i,set()).add(j)
+        queue=[(len(col),j) for j,col in cols.items()]
+        heapq.heapify(queue)
+        rank=0
+        while queue:
+            length,j=heapq.heappop(queue)
+            if j not in cols or len(cols[j])!=length:
+                # Stale entry: the column has since been modified.
+                continue
+            pivot_col=cols.pop(j)
+            r=min(pivot_col,key=lambda i: (len(row_cols[i]),abs(pivot_col[i])))
+            pivot=pivot_col[r]
+            for i in pivot_col:
+                row_cols[i].discard(j)
+            for k in row_cols.pop(r):
+                col=cols[k]
+                c=col.pop(r)
+                g=math.gcd(pivot,c)
+                a,b=pivot//g,c//g
+                if a!=1:
+                    for i in col:
+                        col[i]*=a
+                for i,x in pivot_col.items():
+                    if i==r:
+                        continue
+                    if i in col:
+                        y=col[i]-b*x
+                        if y==0:
+                            del col[i]
+                            row_cols[i].discard(k)
+                        else:
+                            col[i]=y
+                    else:
+                        col[i]=-b*x
+                        row_cols[i].add(k)
+                if col:
+                    g=math.gcd(*col.values())
+                    if g!=1:
+                        for i in col:
+                            col[i]//=g
+                    heapq.heappush(queue,(len(col),k))
+                else:
+                    del cols[k]
+            rank+=1
+        return rank
+
+    def blackbox_rank(self,failure=BLACKBOX_FAILURE,rng=None):
+        '''Returns the rank r of a matrix S over Z/p by Wiedemann's
+        method, with diagonal preconditioning (Chen, Eberly, Kaltofen,
+        Saunders, Turner and Villard, 2002).
+
+        With N=min(rows,columns) and random diagonal matrices D_1, D_2
+        (entries from rng, by default a new random.Random()), the
+        matrix B=D_1 S^T D_2 S D_1 has rank r and (usually) a minimal
+        polynomial of degree r+1, or r if B is invertible. We find the
+        minimal polynomial of the sequence u.B^i v (u, v random) for
+        i<2N+2 by Berlekamp-Massey; only products with S and S^T are
+        needed, so the memory used is linear in S.nnz().
+
+        Each trial gives a lower bound for r. It fails to give r only
+        if a certain Hankel determinant, a polynomial of degree at most
+        (N+1)(9N+4)/2 in the random entries, vanishes; by the
+        Schwartz-Zippel lemma this happens with probability at most
+        eps=(N+1)(9N+4)/(2(p-1)). We take the largest answer from
+        enough trials that eps^trials<=failure, so p must be large
+        compared with N^2 (a word-sized prime, say); otherwise we
+        raise ValueError.
+        '''
+        K=self.field
+        if K.char==0 or K.order!=K.char:
+            raise ValueError('The black-box rank needs a field Z/p')
+        p=K.char
+        m,n=len(self.row_keys),len(self.col_keys)
+        N=min(m,n)
+        if N==0 or not self.data:
+            return 0
+        eps=_blackbox_trial_failure(N,p)
+        if eps>=1:
+            raise ValueError('Z/{} is too small for the black-box rank of a '
+                             'matrix of size {}'.format(p,N))
+        trials=max(1,math.ceil(math.log(failure)/math.log(eps)))
+        if rng is None:
+            rng=random.Random()
+        indptr,indices=self.indptr,self.indices
+        values=[x.value for x in self.data]
+        columns=[(indices[indptr[j]:indptr[j+1]],values[indptr[j]:indptr[j+1]])
+                 for j in range(n)]
+        rank=0
+        for trial in range(trials):
+            d_1=[rng.randrange(1,p) for j in range(n)]
+            d_2=[rng.randrange(1,p) for i in range(m)]
+            u=[rng.randrange(1,p) for j in range(n)]
+            v=[rng.randrange(1,p) for j in range(n)]
+
+            def apply(x):
+                '''Returns Bx.'''
+                y=[0]*m
+                for (rows,vals),a,b in zip(columns,d_1,x):
+                    c=a*b%p
+                    if c:
+                        for i,z in zip(rows,vals):
+                            y[i]+=c*z
+                y=[a*b%p for a,b in zip(d_2,y)]
+                return [a*sum(y[i]*z for i,z in zip(rows,vals))%p
+                        for (rows,vals),a in zip(columns,d_1)]
+
+            sequence=[]
+            for i in range(2*N+2):
+                sequence.append(sum(a*b for a,b in zip(u,v))%p)
+                if i<2*N+1:
+                    v=apply(v)
+            C,L=_berlekamp_massey(sequence,p)
+            # The minimal polynomial is x^L+c_1x^{L-1}+...+c_L, which
+            # is divisible by x iff c_L=0.
+            rank=max(rank,L-1 if C[L]==0 else L)
+            if rank==N:
+                break
+        return rank
+
+    def ker_im(self,method=None,primes=None):
+        '''Returns a 2-tuple of integers (nullity(S),rank(S)).
+
+        If method='multimodular', the rank is computed by
+        S.multimodular_rank(primes), and if method='blackbox' by
+        S.blackbox_rank(); method='auto' picks the black-box rank for
+        large matrices over Z/p with p large (see _use_blackbox).
+        Otherwise this is Gaussian elimination on the columns of S
+        (over the rationals, on integer columns: see
+        fraction_free_rank). To limit fill-in, each pivot is chosen by
+        a Markowitz-style rule: we take a column with the fewest
+        nonzero entries and, within it, the row which meets the fewest
+        other columns.
+        '''
+        if method=='auto':
+            big=_use_blackbox(self.field,len(self.row_keys),len(self.col_keys))
+            method='blackbox' if big else None
+        if method=='multimodular':
+            rank=self.multimodular_rank(primes)
+            return len(self.col_keys)-rank,rank
+        elif method=='blackbox':
+            rank=self.blackbox_rank()
+            return len(self.col_keys)-rank,rank
+        elif method is not None:
+            raise ValueError('Unknown method for ker_im: {}'.format(method))
+        if self.field.char==0:
+            rank=self.fraction_free_rank()
+            return len(self.col_keys)-rank,rank
+        cols={}
+        row_cols={}
+        for j in range(len(self.col_keys)):
+            col=self.column(j)
+            if col:
+                cols[j]=col
+                for i in col:
+                    row_cols.setdefault(i,set()).add(j)
+        queue=[(len(col),j) for j,col in cols.items()]
+        heapq.heapify(queue)
+        rank=0
+        while queue:
+            length,j=heapq.heappop(queue)
+            if j not in cols or len(cols[j])!=length:
+                # Stale entry: the column has since been modified.
+                continue
+            pivot_col=cols.pop(j)
+            r=min(pivot_col,key=lambda i: len(row_cols[i]))
+            pivot=pivot_col[r]
+            for i in pivot_col:
+                row_cols[i].discard(j)
+            for k in row_cols.pop(r):
+                col=cols[k]
+                factor=col.pop(r)/pivot
+                for i,x in pivot_col.items():
+                    if i==r:
+                        continue
+                    if i in col:
+                        y=col[i]-factor*x
+                        if y==0:
+                            del col[i]
+                            row_cols[i].discard(k)
+                        else:
+                            col[i]=y
+                    else:
+                        col[i]=-(factor*x)
+                        row_cols[i].add(k)
+                if col:
+                    heapq.heappush(queue,(len(col),k))
+                else:
+                    del cols[k]
+            rank+=1
+        return len(self.col_keys)-rank,rank
+
+
+class Echelon(AlgebraicStructure):
+    '''Class of incremental echelon forms.
+
+    USAGE:
+
+        E=Echelon(K)
+
+    creates an empty echelon form over the field K. Vectors (given as
+    dictionaries of components {i: Number}) are added one at a time
+    with E.add(v,label) and are remembered by their labels.
+
+    ATTRIBUTES:
+
+        E.field [fi.Field]
+
+        E.rows [dict] {pivot: (components, combination)}
+
+            The reduced vectors, indexed by their pivot. The vector
+            stored under a pivot has zero component at every earlier
+            pivot, and combination [dict] {label: Number} records how
+            to write it in terms of the vectors which were added.
+
+        E.labels [list]
+
+            The labels of the vectors which were linearly independent
+            of those added before them.
+
+    METHODS:
+
+        E.reduce(v)
+
+            Returns a 2-tuple (remainder,combination) such that
+
+                v = remainder + sum of combination[l]*(vector l)
+
+            and remainder has zero component at every pivot; v lies
+            in the span of the vectors added so far iff remainder is
+            empty.
+
+        E.add(v,label)
+
+            Adds v to the echelon form and returns E.reduce(v)
+            (computed before v was added).
+
+        E.rank()
+
+            Returns the dimension of the span of the vectors added.
+    '''
+    _required_fields=['field']
+    _empty_dictionaries=['rows']
+
+    def __init__(self,*args):
+        super().__init__(*args)
+        self.labels=[]
+
+    def reduce(self,v):
+        '''Returns (remainder,combination) with v = remainder +
+        sum of combination[l]*(vector l).'''
+        w={i: x for i,x in v.items() if x!=0}
+        combination={}
+        for pivot,(row,row_combination) in self.rows.items():
+            if pivot in w:
+                t=w[pivot]/row[pivot]
+                for i,x in row.items():
+                    if i in w:
+                        y=w[i]-t*x
+                        if y==0:
+                            del w[i]
+                        else:
+                            w[i]=y
+                    else:
+                        w[i]=-(t*x)
+                for l,x in row_combination.items():
+                    if l in combination:
+                        combination[l]=combination[l]+t*x
+                    else:
+                        combination[l]=t*x
+        return w,combination
+
+    def add(self,v,label):
+        '''Adds the vector v (with the given label) to the echelon form.'''
+        remainder,combination=self.reduce(v)
+        if remainder:
+            row_combination={l: -x for l,x in combination.items()}
+            row_combination[label]=self.field.one
+            self.rows[next(iter(remainder))]=(remainder,row_combination)
+            self.labels.append(label)
+        return remainder,combination
+
+    def rank(self):
+        '''Returns the dimension of the span of the vectors added.'''
+        return len(self.rows)
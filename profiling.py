@@ -0,0 +1,197 @@
+#!/usr/bin/python
+
+# Opt-in instrumentation for the stages of a twist. Inside a
+#
+#     with Profiler() as P:
+#         ...
+#
+# block, the methods listed in STAGES are wrapped so that each call
+# records its wall time and the size of what it worked on; outside the
+# block the original methods are back in place, so there is no cost
+# at all when profiling is not in use.
+
+import time
+
+from linear_algebra import *
+import a_infinity as ainf
+
+def map_size(F):
+    '''Returns a 2-tuple (number of basis elements of the source, number
+    of nonzero entries) for a linear map F. The entries of a
+    KroneckerMap are the products of those of its factors, so they
+    are counted from the factors rather than computed.'''
+    if isinstance(F,KroneckerMap):
+        nnz=1
+        for f in F.factors:
+            nnz*=map_size(f)[1]
+        return len(F.source.basis),nnz
+    nnz=sum(1 for v in F.maps.values()
+            for x in v.components.values() if x!=0)
+    return len(F.source.basis),nnz
+
+def module_size(M):
+    '''Returns a 2-tuple (number of basis elements, number of nonzero
+    entries of the operations) for an A_\\infty-module M.'''
+    basis=sum(len(M[X].basis) for X in M.modules)
+    nnz=sum(map_size(F)[1] for F in M.operations.values())
+    return basis,nnz
+
+def columns_size(cols):
+    '''Returns a 2-tuple (number of columns, number of entries) for a
+    dictionary of columns {index: {index: number}}, as returned by the
+    methods of TwistColumns.'''
+    return len(cols),sum(len(col) for col in cols.values())
+
+def size(obj):
+    '''Returns map_size, module_size or columns_size of obj as
+    appropriate, and (0,0) for anything else.'''
+    if isinstance(obj,LinearMap):
+        return map_size(obj)
+    if isinstance(obj,ainf.A8Module):
+        return module_size(obj)
+    if isinstance(obj,dict):
+        return columns_size(obj)
+    return 0,0
+
+# The stages we know how to instrument, as 4-tuples
+#
+#     (stage name, class, method name, what to measure)
+#
+# where we measure either the 'result' of the call or the object
+# ('self') it was called on. A twist is built in a single pass (see
+# A8Module.twist), so its time is split between the three kinds of
+# columns of TwistColumns; otimes, cone, flatten, unflatten and
+# simplify only appear when tensor products of complexes, cones of
+# module maps, verify or simplify are used directly.
+STAGES=[('twist',ainf.A8Module,'twist','result'),
+        ('yoneda',ainf.A8Category,'yoneda','result'),
+        ('twist_differential',ainf.TwistColumns,'differential_columns','result'),
+        ('twist_evaluation',ainf.TwistColumns,'evaluation_columns','result'),
+        ('twist_operations',ainf.TwistColumns,'operation_columns','result'),
+        ('otimes',ainf.CochainComplex,'otimes','result'),
+        ('cone',ainf.A8ModuleMap,'cone','result'),
+        ('simplify',ainf.A8Module,'simplify','result'),
+        ('minimal_model',ainf.A8Module,'minimal_model','result'),
+        ('flatten',LinearMap,'flatten','result'),
+        ('unflatten',LinearMap,'unflatten','result'),
+        ('flatten',KroneckerMap,'flatten','result'),
+        ('unflatten',KroneckerMap,'unflatten','result'),
+        ('ker_im',LinearMap,'ker_im','self')]
+
+class Profiler():
+    '''Records time and sizes for the stages of a twist.
+
+    USAGE:
+
+        with Profiler(stages=None,sizes=True) as P:
+            M.twist(X).total()
+        P.display()
+
+    While the with-block runs, every call to one of the methods in
+    STAGES (or the given list of stage names) is timed and counted,
+    and if sizes=True the number of basis elements and nonzero map
+    entries of its result (or, for ker_im, of the map being reduced;
+    for the twist_* stages, the number of columns and entries) are
+    added up. Calls to ker_im are the ones made by
+    CochainComplex.cohomology.
+
+    ATTRIBUTES:
+
+        P.report [dict] {stage: {statistic: number}}
+
+            For each stage that was called, a dictionary with entries
+
+                'calls'      the number of calls
+                'time'       total wall time in seconds
+                'self_time'  time not spent in other instrumented stages
+                'basis'      total number of basis elements
+                'nnz'        total number of nonzero entries
+                'max_basis'  the largest single number of basis elements
+                'max_nnz'    the largest single number of nonzero entries
+
+            The time spent measuring sizes is not included in any
+            of the times.
+
+    METHODS:
+
+        P.display()
+
+            Prints the report as a table, sorted by total time.
+
+        P.reset()
+
+            Clears the report.
+    '''
+    def __init__(self,stages=None,sizes=True):
+        self.stages=[s for s in STAGES if stages is None or s[0] in stages]
+        self.sizes=sizes
+        self.report={}
+        self.stack=[]
+        self.originals=[]
+
+    def reset(self):
+        '''Clears the report.'''
+        self.report={}
+
+    def record(self,stage,elapsed,self_time,basis,nnz):
+        '''Adds one call to the report.'''
+        if stage not in self.report:
+            self.report[stage]={'calls': 0,'time': 0.0,'self_time': 0.0,
+                                'basis': 0,'nnz': 0,
+                                'max_basis': 0,'max_nnz': 0}
+        entry=self.report[stage]
+        entry['calls']+=1
+        entry['time']+=elapsed
+        entry['self_time']+=self_time
+        entry['basis']+=basis
+        entry['nnz']+=nnz
+        entry['max_basis']=max(entry['max_basis'],basis)
+        entry['max_nnz']=max(entry['max_nnz'],nnz)
+
+    def wrap(self,stage,method,measure):
+        '''Returns a version of method which records calls to stage.'''
+        profiler=self
+        def wrapper(obj,*args,**kwargs):
+            # Each frame is [time in child stages, time spent measuring].
+            frame=[0.0,0.0]
+            profiler.stack.append(frame)
+            start=time.perf_counter()
+            try:
+                result=method(obj,*args,**kwargs)
+            finally:
+                elapsed=time.perf_counter()-start-frame[1]
+                profiler.stack.pop()
+            start=time.perf_counter()
+            basis,nnz=size(result if measure=='result' else obj) if profiler.sizes else (0,0)
+            measuring=time.perf_counter()-start+frame[1]
+            profiler.record(stage,elapsed,elapsed-frame[0],basis,nnz)
+            if profiler.stack:
+                profiler.stack[-1][0]+=elapsed
+                profiler.stack[-1][1]+=measuring
+            return result
+        wrapper.__name__=method.__name__
+        wrapper.__doc__=method.__doc__
+        return wrapper
+
+    def __enter__(self):
+        for stage,cls,name,measure in self.stages:
+            method=cls.__dict__[name]
+            self.originals.append((cls,name,method))
+            setattr(cls,name,self.wrap(stage,method,measure))
+        return self
+
+    def __exit__(self,*exc):
+        while self.originals:
+            cls,name,method=self.originals.pop()
+            setattr(cls,name,method)
+        return False
+
+    def display(self):
+        '''Prints the report as a table.'''
+        print('%-18s %7s %10s %10s %10s %12s' %
+              ('stage','calls','time','self','basis','nnz'))
+        for stage,entry in sorted(self.report.items(),
+                                  key=lambda item: -item[1]['time']):
+            print('%-18s %7d %9.4fs %9.4fs %10d %12d' %
+                  (stage,entry['calls'],entry['time'],entry['self_time'],
+                   entry['basis'],entry['nnz']))
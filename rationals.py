@@ -2,6 +2,8 @@
 
 import fields as fi
 import arithmetic as ar
+from array import array
+from math import gcd
 
 def rat_normal_form(a,b):
     '''Puts the numerator and denominator into normal form:
@@ -66,7 +68,7 @@ def rat_neg(x):
         
 def rat_eq(x,y):
     '''Tests equality of rational numbers'''
-    if type(y) is fi.Number:
+    if isinstance(y,fi.FieldElement):
         if x.numerator==y.numerator and x.denominator==y.denominator:
             # Since rational numbers are stored with their numerator and
             # denominator coprime and the sign in the numerator,
@@ -93,7 +95,194 @@ def rat_print(x):
     else:
         return str(x.numerator)
 
-def QQ():
-    '''Defines an instance of the field of rational numbers'''
-    return fi.Field(rat_init,rat_add,rat_sub,rat_mul,rat_div,
-                    rat_inv,rat_neg,rat_eq,rat_num,rat_print,0)
+def QQ(lazy=False):
+    '''Defines an instance of the field of rational numbers. If lazy is
+    True, numbers are only put into normal form when they are hashed,
+    printed or stored, or when they grow too large (see
+    RationalField).'''
+    return RationalField(rat_init,rat_add,rat_sub,rat_mul,rat_div,
+                         rat_inv,rat_neg,rat_eq,rat_num,rat_print,0,
+                         lazy=lazy)
+
+# In a lazy copy of QQ, a fraction whose numerator or denominator is at
+# least this large is reduced anyway, so that the integers in a long
+# calculation cannot grow without bound.
+LAZY_LIMIT=2**62
+
+class RationalField(fi.Field):
+    '''The field of rational numbers, as created by QQ().
+
+    Numbers over QQ are Rationals rather than generic Numbers, and any
+    two copies of QQ are equal.
+
+    The field made by QQ(lazy=True) skips the gcd which puts the result
+    of each addition, subtraction, multiplication and division into
+    normal form: its numbers only have a positive denominator, and are
+    reduced by Rational.normalize() when they are hashed, printed,
+    stored or reduced mod p, or once their numerator or denominator
+    reaches LAZY_LIMIT. Most intermediate results of an elimination are
+    used once and thrown away, so most of these gcds are never needed.
+    Equality is tested by cross-multiplying, so it does not depend on
+    the normal form.
+    '''
+    def __init__(self,*args,lazy=False):
+        self.constants={}
+        self.lazy=lazy
+        super().__init__(*args)
+        self.constants={(0,1): self.zero,(1,1): self.one,(-1,1): self.minus_one}
+
+    def __call__(self,n):
+        '''Sends an integer n to the rational number n/1.'''
+        if isinstance(n,fi.FieldElement):
+            return n
+        else:
+            return self.element(n,1)
+
+    def element(self,a,b):
+        '''Returns the rational number a/b, where b>0 and a and b are
+        coprime, reusing the stored constants 0, 1 and -1 where
+        possible.'''
+        x=self.constants.get((a,b))
+        if x is None:
+            return Rational(self,a,b)
+        return x
+
+    def fraction(self,a,b):
+        '''Returns the rational number a/b, putting it into normal form
+        (unless K is lazy and a and b are small).'''
+        if b==0:
+            raise ZeroDivisionError("Tried to divide by zero!")
+        if b<0:
+            a,b=-a,-b
+        if self.lazy and b<LAZY_LIMIT and -LAZY_LIMIT<a<LAZY_LIMIT:
+            if a==0:
+                return self.zero
+            return self.element(a,b)
+        g=gcd(a,b)
+        if g!=1:
+            a,b=a//g,b//g
+        return self.element(a,b)
+
+    def pack(self,numbers):
+        '''Returns the 2-tuple (numerators,denominators) of the numbers,
+        as arrays of 64-bit integers if they fit and as lists
+        otherwise. If every denominator is 1 then denominators is
+        None.'''
+        numbers=[x.normalize() for x in numbers]
+        numerators=[x.numerator for x in numbers]
+        denominators=[x.denominator for x in numbers]
+        if all(b==1 for b in denominators):
+            denominators=None
+        try:
+            numerators=array('q',numerators)
+            if denominators is not None:
+                denominators=array('q',denominators)
+        except OverflowError:
+            pass
+        return numerators,denominators
+
+    def unpack(self,data):
+        '''Returns the list of numbers stored by pack.'''
+        numerators,denominators=data
+        if denominators is None:
+            return [self.element(a,1) for a in numerators]
+        return [self.element(a,b) for a,b in zip(numerators,denominators)]
+
+    def descriptor(self):
+        '''Returns ('QQ',) (see fields.from_descriptor).'''
+        return ('QQ',)
+
+    def __eq__(self,other):
+        return type(other) is RationalField
+
+    def __hash__(self):
+        return hash('QQ')
+
+    def __reduce__(self):
+        return (QQ,(self.lazy,))
+
+class Rational(fi.FieldElement):
+    '''A rational number, stored in normal form: the denominator is
+    positive and coprime to the numerator. Over a lazy copy of QQ, the
+    denominator is positive but the fraction may not be reduced until
+    normalize() is called.'''
+    __slots__=('field','numerator','denominator')
+
+    def __init__(self,K,numerator,denominator):
+        self.field=K
+        self.numerator=numerator
+        self.denominator=denominator
+
+    def __add__(self,other):
+        a,b=self.numerator,self.denominator
+        c,d=other.numerator,other.denominator
+        if b==d:
+            return self.field.fraction(a+c,b)
+        return self.field.fraction(a*d+b*c,b*d)
+
+    def __sub__(self,other):
+        a,b=self.numerator,self.denominator
+        c,d=other.numerator,other.denominator
+        if b==d:
+            return self.field.fraction(a-c,b)
+        return self.field.fraction(a*d-b*c,b*d)
+
+    def __mul__(self,other):
+        if isinstance(other,fi.FieldElement):
+            return self.field.fraction(self.numerator*other.numerator,
+                                       self.denominator*other.denominator)
+        else:
+            return NotImplemented
+
+    def __truediv__(self,other):
+        return self.field.fraction(self.numerator*other.denominator,
+                                   self.denominator*other.numerator)
+
+    def __neg__(self):
+        return self.field.element(-self.numerator,self.denominator)
+
+    def I(self):
+        '''Inversion of rational numbers'''
+        return self.field.fraction(self.denominator,self.numerator)
+
+    def normalize(self):
+        '''Reduces the fraction in place, and returns the number.'''
+        if self.field.lazy:
+            g=gcd(self.numerator,self.denominator)
+            if g!=1:
+                self.numerator//=g
+                self.denominator//=g
+        return self
+
+    def residue(self,p):
+        '''Returns the reduction of the number mod the prime p as an
+        integer 0<=n<p, or None if p divides the denominator.'''
+        self.normalize()
+        if self.denominator%p==0:
+            return None
+        return self.numerator*pow(self.denominator,-1,p)%p
+
+    def __eq__(self,other):
+        '''Tests equality with rational numbers or with integers.'''
+        if isinstance(other,fi.FieldElement):
+            if self.denominator==other.denominator:
+                return self.numerator==other.numerator
+            # Denominators are positive, so this is a/b==c/d whether
+            # or not the fractions are reduced.
+            return (self.numerator*other.denominator==
+                    self.denominator*other.numerator)
+        else:
+            return self.numerator==other*self.denominator
+
+    def __hash__(self):
+        self.normalize()
+        if self.denominator==1:
+            return hash(self.numerator)
+        return hash((self.numerator,self.denominator))
+
+    def __str__(self):
+        return rat_print(self.normalize())
+
+    def __reduce__(self):
+        self.normalize()
+        return (self.field.element,(self.numerator,self.denominator))
@@ -0,0 +1,370 @@
+#!/usr/bin/python
+
+# Saving and loading A_\infty-categories, A_\infty-modules and cochain
+# complexes in a compact binary format, so that long computations can
+# be checkpointed and their results shared between jobs.
+#
+# A file consists of
+#
+#     MAGIC (8 bytes)
+#     version, header length (two little-endian 64-bit integers)
+#     header
+#     arrays
+#
+# The header is a pickle of plain data (numbers, strings, tuples,
+# lists, sets and dictionaries) describing the object: its field (by
+# its descriptor, see fields.from_descriptor), the gradings and
+# labels of every basis, and for every linear map its degree and the
+# positions in the file of its three arrays (see ColumnarMap). Each
+# array starts at a multiple of 8 bytes. Bases which are indexed by
+# 0,1,2,... (as they are after a twist) do not store their labels.
+#
+# load() memory-maps the file: the operations of a module are read
+# from the mapping only when they are asked for, so opening even a
+# large module is quick.
+#
+# The same data can be put in shared memory instead of a file with
+# share(), so that worker processes can read a module without it
+# being pickled and copied to each of them (see Shared).
+
+import io
+import mmap
+from multiprocessing import resource_tracker, shared_memory
+import os
+import pickle
+import struct
+import sys
+
+import fields as fi
+from linear_algebra import *
+import a_infinity as ainf
+
+MAGIC=b'ALPYDATA'
+VERSION=1
+ALIGN=8
+
+class _Writer():
+    '''Collects the arrays to be written after the header, recording
+    where each one will go.'''
+    def __init__(self):
+        self.arrays=[]
+        self.size=0
+
+    def add(self,data):
+        '''Returns a reference to an array, which will be written at the
+        next free aligned position.'''
+        offset=self.size
+        self.arrays.append(data)
+        nbytes=len(data)*data.itemsize
+        self.size+=nbytes+(-nbytes)%ALIGN
+        return ('array',data.typecode,data.itemsize,offset,len(data))
+
+    def encode(self,data):
+        '''Replaces the arrays in data (an array, a tuple of them or any
+        other picklable value) by references.'''
+        if isinstance(data,memoryview):
+            data=array(data.format,data)
+        if isinstance(data,array):
+            return self.add(data)
+        elif isinstance(data,tuple):
+            return ('tuple',tuple(self.encode(x) for x in data))
+        return ('value',data)
+
+    def space(self,V):
+        '''Returns the header entry for the vector space V.'''
+        gradings=list(V.basis.values())
+        try:
+            gradings=array('b',gradings)
+        except OverflowError:
+            gradings=array('q',gradings)
+        if all(i==n for n,i in enumerate(V.basis)):
+            keys=None
+        else:
+            keys=list(V.basis)
+        return {'gradings': self.add(gradings),'keys': keys}
+
+    def linear_map(self,F):
+        '''Returns the header entry for the linear map F (a LinearMap or
+        a ColumnarMap).'''
+        if not isinstance(F,ColumnarMap):
+            F=F.columnar()
+        return {'deg': F.deg,'cols': self.encode(F.cols),
+                'rows': self.encode(F.rows),'data': self.encode(F.data)}
+
+    def category(self,A):
+        '''Returns the header entry for the A_\\infty-category A.'''
+        return {'objects': A.objects,
+                'morphisms': {pair: self.space(V)
+                              for pair,V in A.morphisms.items()},
+                'operations': {word: self.linear_map(F)
+                               for word,F in A.operations.items()}}
+
+    def write(self,f,header):
+        '''Writes the file, with the given header.'''
+        header=pickle.dumps(header,protocol=pickle.HIGHEST_PROTOCOL)
+        f.write(MAGIC)
+        f.write(struct.pack('<QQ',VERSION,len(header)))
+        f.write(header)
+        f.write(bytes((-f.tell())%ALIGN))
+        for data in self.arrays:
+            nbytes=len(data)*data.itemsize
+            f.write(data.tobytes())
+            f.write(bytes((-nbytes)%ALIGN))
+
+class _Reader():
+    '''Reads the objects described by a header from a memory-mapped
+    file.'''
+    def __init__(self,buffer,start,field):
+        self.buffer=buffer
+        self.start=start
+        self.field=field
+
+    def decode(self,ref):
+        '''Returns the data (arrays are memoryviews of the file) which
+        ref refers to.'''
+        if ref[0]=='array':
+            typecode,itemsize,offset,count=ref[1:]
+            if array(typecode).itemsize!=itemsize:
+                raise ValueError('Array of type {} has the wrong size on '
+                                 'this platform'.format(typecode))
+            offset+=self.start
+            return self.buffer[offset:offset+count*itemsize].cast(typecode)
+        elif ref[0]=='tuple':
+            return tuple(self.decode(x) for x in ref[1])
+        return ref[1]
+
+    def space(self,entry):
+        '''Returns the vector space described by entry.'''
+        V=VectorSpace(self.field)
+        gradings=self.decode(entry['gradings'])
+        keys=entry['keys']
+        if keys is None:
+            keys=range(len(gradings))
+        V.basis.update(zip(keys,gradings))
+        return V
+
+    def linear_map(self,entry,source,target):
+        '''Returns the ColumnarMap source-->target described by entry.'''
+        return ColumnarMap(source,target,entry['deg'],
+                           self.decode(entry['cols']),
+                           self.decode(entry['rows']),
+                           self.decode(entry['data']))
+
+    def category(self,entry):
+        '''Returns the A_\\infty-category described by entry.'''
+        A=ainf.A8Category(self.field,entry['objects'],{},{})
+        A.morphisms.update({pair: self.space(V)
+                            for pair,V in entry['morphisms'].items()})
+        # The operations of a category are used over and over again,
+        # so we read them all in straight away.
+        A.operations.update({word: self.linear_map(F,A.hom(*word),
+                                                   A[(word[0],word[-1])])
+                             .to_map()
+                             for word,F in entry['operations'].items()})
+        return A
+
+def _prepare(obj):
+    '''Returns a 2-tuple (writer,header) for the object obj.'''
+    writer=_Writer()
+    if isinstance(obj,ainf.A8Category):
+        kind,K='category',obj.field
+        body=writer.category(obj)
+    elif isinstance(obj,ainf.A8Module):
+        kind,K='module',obj.field
+        if isinstance(obj.operations,ainf.ColumnarOperations):
+            operations=obj.operations.columns
+        else:
+            operations=obj.operations
+        body={'category': writer.category(obj.cat),
+              'modules': {X: writer.space(V) for X,V in obj.modules.items()},
+              'operations': {word: writer.linear_map(F)
+                             for word,F in operations.items()}}
+    elif isinstance(obj,ainf.CochainComplex):
+        kind,K='complex',obj.cochains.field
+        body={'cochains': writer.space(obj.cochains),
+              'differential': writer.linear_map(obj.differential)}
+    else:
+        raise TypeError('Cannot save objects of type {}'.format(type(obj)))
+    header={'kind': kind,'field': K.descriptor(),
+            'byteorder': sys.byteorder,'body': body}
+    return writer,header
+
+def _read(buffer,category,origin):
+    '''Returns the object stored in buffer (a memoryview), which came
+    from origin (a file name, used in error messages).'''
+    if bytes(buffer[:len(MAGIC)])!=MAGIC:
+        raise ValueError('{} is not alpy data'.format(origin))
+    version,length=struct.unpack_from('<QQ',buffer,len(MAGIC))
+    if version!=VERSION:
+        raise ValueError('{} has unsupported version {}'.format(origin,version))
+    start=len(MAGIC)+16
+    header=pickle.loads(buffer[start:start+length])
+    if header['byteorder']!=sys.byteorder:
+        raise ValueError('{} was saved with a different byte order'.format(origin))
+    start+=length
+    start+=(-start)%ALIGN
+    K=fi.from_descriptor(header['field'])
+    reader=_Reader(buffer,start,K)
+    kind,body=header['kind'],header['body']
+    if kind=='category':
+        return reader.category(body)
+    elif kind=='module':
+        if category is None:
+            category=reader.category(body['category'])
+        elif category.field!=K:
+            raise ValueError('Module and category have different fields')
+        M=ainf.A8Module(category,{},ainf.ColumnarOperations())
+        M.modules.update({X: reader.space(V)
+                          for X,V in body['modules'].items()})
+        for word,F in body['operations'].items():
+            template=M.mu(*word)
+            M.operations.columns[word]=reader.linear_map(
+                F,template.source,template.target)
+        return M
+    elif kind=='complex':
+        V=reader.space(body['cochains'])
+        d=reader.linear_map(body['differential'],V,V).to_map()
+        return ainf.CochainComplex(V,d)
+    raise ValueError('{} contains an unknown kind of object: {}'.format(origin,kind))
+
+def save(obj,path):
+    '''Saves an A8Category, A8Module or CochainComplex to the file
+    path. The field must be FF(p) or QQ().'''
+    writer,header=_prepare(obj)
+    # Write to a temporary file first so that an interrupted run never
+    # leaves a truncated file behind.
+    tmp=path+'.%d.tmp' % os.getpid()
+    with open(tmp,'wb') as f:
+        writer.write(f,header)
+    os.replace(tmp,path)
+
+def load(path,category=None):
+    '''Loads an object saved by save(obj,path). For a module, the
+    category it is defined over can be passed in (so that several
+    modules share it); otherwise it is read from the file.
+
+    The file is memory-mapped, and a module is returned in compact form
+    (see A8Module.compact) with its operations read from the file
+    when they are needed.'''
+    with open(path,'rb') as f:
+        buffer=memoryview(mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ))
+    return _read(buffer,category,path)
+
+# The shared memory segments attached to by this process. They are
+# kept open for as long as the process runs (or until Shared.close()
+# is called), since the objects read from them point into them.
+_segments={}
+
+class Shared():
+    '''A handle to an object exported to shared memory by share(obj).
+
+    USAGE:
+
+        with storage.share(M) as S:
+            results=executor.map(work,[S]*n)
+
+    where, in each worker process,
+
+        def work(S):
+            M=S.attach()
+            ...
+
+    The handle itself is tiny, so it is cheap to send to workers, and
+    S.attach() reads the object straight out of the shared memory
+    (in the same format as storage.save, see above) without copying
+    its operations. Leaving the with-block (or calling S.unlink() in
+    the process which called share) frees the shared memory; workers
+    must have finished with it by then. Objects which that process
+    has read with S.attach() itself should be dropped before then
+    too: otherwise the segment is still freed, but its mapping stays
+    open (and in use) until the process exits.
+
+    ATTRIBUTES:
+
+        S.name [str]
+
+            The name of the shared memory segment.
+
+        S.size [int]
+
+            The number of bytes of data in it.
+
+    METHODS:
+
+        S.attach(category=None)
+
+            Returns the object, as storage.load would.
+
+        S.close()
+
+            Detaches this process from the segment.
+
+        S.unlink()
+
+            Detaches and frees the segment.
+    '''
+    def __init__(self,name,size):
+        self.name=name
+        self.size=size
+
+    def segment(self):
+        '''Returns the SharedMemory segment, attaching to it if need be.'''
+        if self.name not in _segments:
+            if sys.version_info>=(3,13):
+                shm=shared_memory.SharedMemory(self.name,track=False)
+            else:
+                shm=shared_memory.SharedMemory(self.name)
+                # Otherwise this process would free the segment when it
+                # exits, although it did not create it.
+                resource_tracker.unregister(shm._name,'shared_memory')
+            _segments[self.name]=shm
+        return _segments[self.name]
+
+    def attach(self,category=None):
+        '''Returns the object stored in the segment.'''
+        buffer=self.segment().buf[:self.size]
+        return _read(buffer,category,'Shared memory '+self.name)
+
+    def close(self):
+        '''Detaches this process from the segment. Anything read from it
+        must no longer be in use (otherwise BufferError is raised and
+        the segment stays attached).'''
+        shm=_segments.get(self.name)
+        if shm is not None:
+            shm.close()
+            del _segments[self.name]
+
+    def unlink(self):
+        '''Frees the segment and detaches this process from it.'''
+        shm=self.segment()
+        if sys.version_info<(3,13):
+            # Worker processes started by multiprocessing share our
+            # resource tracker, so their unregister (see segment) may
+            # have removed our own registration.
+            resource_tracker.register(shm._name,'shared_memory')
+        shm.unlink()
+        try:
+            self.close()
+        except BufferError:
+            # Objects read from the segment by this process are still
+            # alive; the mapping stays open until they are gone (the
+            # segment itself has already been freed).
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.unlink()
+
+def share(obj):
+    '''Copies an A8Category, A8Module or CochainComplex into a new
+    shared memory segment and returns a Shared handle to it.'''
+    writer,header=_prepare(obj)
+    f=io.BytesIO()
+    writer.write(f,header)
+    data=f.getbuffer()
+    shm=shared_memory.SharedMemory(create=True,size=len(data))
+    shm.buf[:len(data)]=data
+    _segments[shm.name]=shm
+    return Shared(shm.name,len(data))
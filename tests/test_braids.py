@@ -0,0 +1,49 @@
+#!/usr/bin/python
+
+# Checks that BraidMonoid.words(n), which tests each word with
+# is_normal, lists exactly the normal forms found by searching the
+# whole class of every word of length at most n.
+
+import itertools
+import os
+import sys
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+
+import finite_fields as ff
+import a_infinity as ainf
+from braids import BraidMonoid
+
+def brute_force_words(B,n):
+    '''Returns the set of normal forms of the words of length at most n.'''
+    return {B.normal_form(word) for length in range(n+1)
+            for word in itertools.product(B.objects,repeat=length)}
+
+def check(B,n):
+    words=list(B.words(n))
+    assert len(words)==len(set(words))
+    assert set(words)==brute_force_words(B,n)
+
+def test_category():
+    check(BraidMonoid.from_category(ainf.BP(4,2,ff.FF(2),2,1)),5)
+
+def test_graph():
+    # The A_4 graph: neighbours satisfy the braid relation and the
+    # others commute.
+    relations={}
+    for X in range(4):
+        for Y in range(4):
+            if X!=Y:
+                relations[(X,Y)]=3 if abs(X-Y)==1 else 2
+    check(BraidMonoid(range(4),relations),4)
+
+def test_mixed():
+    # 0 and 1 commute, 1 and 2 braid, 0 and 2 satisfy no relation.
+    relations={(0,1): 2,(1,0): 2,(1,2): 3,(2,1): 3}
+    check(BraidMonoid(range(3),relations),5)
+
+if __name__=='__main__':
+    test_category()
+    test_graph()
+    test_mixed()
+    print('ok')
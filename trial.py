@@ -3,6 +3,7 @@
 import finite_fields as ff
 import rationals as QQ
 import a_infinity as ainf
+from braids import BraidMonoid
 from itertools import permutations,combinations_with_replacement
 
 K=ff.FF(2)
@@ -11,6 +12,8 @@ depth=4
 milnor_number=3
 A=ainf.BP(milnor_number+1,2,K,2,1)
 B=ainf.BP(milnor_number+1,2,K,N,1)
+# A and B have the same Dynkin graph, hence the same braid monoid.
+braids=BraidMonoid.from_category(A)
 
 def word_twist(w,P):
     for n in w:
@@ -25,7 +28,8 @@ def depth_twist():
             new_results={}
             for w in results:
                 for X in results[()].cat.objects:
-                    new_results.update({w+(X,): results[w].twist(X)})
+                    if braids.is_normal(w+(X,)):
+                        new_results.update({w+(X,): results[w].twist(X)})
                     #new_results[w+(X,)].verify()
             results.update(new_results)
 